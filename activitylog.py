@@ -0,0 +1,418 @@
+"""Activity logs streamed to disk
+
+An ActivityLog passed to a Monitor as its sink writes every activity the
+monitor is notified of to disk as the simulation runs, so a run of any
+length can be audited without holding its activities in memory. Activities
+are gathered in a write buffer of fixed size and written out a buffer at a
+time, and a new file is started for the next activity whenever the current
+one reaches its size limit. The files of a log at activities.csv are
+activities.csv, activities.1.csv, activities.2.csv and so on, skipping any
+name that is already taken.
+
+A log can be pickled, e.g. in a simulation checkpoint, and is inherited by
+the processes forked from this one, e.g. by fork.branch. Either way its
+buffer is written out first, and the copy goes on in a new file of the
+series, so that copies running side by side never write to the same file.
+A run resumed from a checkpoint by Simulation.resume instead rewinds its
+log to the point the checkpoint was saved at, throwing away whatever the
+interrupted run wrote to the same file after it, and goes on from there.
+
+A log is written in one of three formats:
+
+    csv:    a header row, then time,category,description,id,row,col rows
+    jsonl:  one JSON object per line, with the same fields
+    binary: fixed-width records, laid out like a binary event trace:
+
+    header:  magic b'UBAL', format version, record count and the offset of
+             the name table, as tracefile.HEADER
+    records: one RECORD per activity, in the order of notification
+    names:   the identifiers of the actors in this file, separated by
+             newlines
+
+Each binary record holds the time, the category and description codes of
+monitor.CATEGORIES and monitor.DESCRIPTIONS, the index of the actor's
+identifier in the name table, and the row and column of the location. Every
+file has its own name table, so it can be read on its own.
+"""
+
+import atexit
+import csv
+import io
+import json
+import os
+import struct
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from location import Location
+from monitor import CATEGORIES, DESCRIPTIONS, _CATEGORY_CODES, \
+    _DESCRIPTION_CODES
+from tracefile import HEADER, mapped_records
+
+FORMATS = ('csv', 'jsonl', 'binary')
+
+MAGIC = b'UBAL'
+VERSION = 1
+RECORD = struct.Struct('<qBBxxIii')
+
+_FIELDS = ('time', 'category', 'description', 'id', 'row', 'col')
+
+# Every log of this process that has not been closed, so that they can be
+# written out before a fork and when the interpreter exits.
+_logs = set()
+
+
+class ActivityLog:
+    """A monitor sink that writes every activity to a series of files.
+
+    === Attributes ===
+    path: The name of the first file of the log.
+    format: The format of the log: 'csv', 'jsonl' or 'binary'.
+    max_bytes: The size at which a file is closed and the next one started.
+        A file can exceed it by at most one activity, and a binary file by
+        its name table too.
+    buffer_bytes: The size of the write buffer.
+    files: The name of every file written so far, in order, including those
+        written before this log was copied.
+    count: The number of activities written so far.
+    """
+    path: str
+    format: str
+    max_bytes: int
+    buffer_bytes: int
+    files: List[str]
+    count: int
+
+    # === Private Attributes ===
+    _file: Optional[io.RawIOBase]
+    #     The file being written, unbuffered, or None if this log is a copy
+    #     that has not started its own file yet.
+    _size: int
+    #     The number of bytes written to _file so far.
+    _text: io.StringIO
+    #     The write buffer of a csv or jsonl log.
+    _csv: csv.writer
+    #     The writer of csv rows to _text.
+    _binary: bytearray
+    #     The write buffer of a binary log.
+    _names: Dict[str, int]
+    #     The index of each identifier in the name table of _file.
+    _records: int
+    #     The number of records in _file.
+
+    def __init__(self, path: str, format: str = 'csv',
+                 max_bytes: int = 1 << 30,
+                 buffer_bytes: int = 1 << 20) -> None:
+        """Initialize an ActivityLog, and start its first file at <path>.
+
+        """
+        if format not in FORMATS:
+            raise ValueError("Unknown activity log format: {}".format(format))
+        self.path = path
+        self.format = format
+        self.max_bytes = max_bytes
+        self.buffer_bytes = buffer_bytes
+        self.files = []
+        self.count = 0
+        self._start_buffers()
+        self._open()
+        _logs.add(self)
+
+    def __enter__(self) -> 'ActivityLog':
+        """Return this log, to be closed at the end of a with statement.
+
+        """
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Close this log.
+
+        """
+        self.close()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Write out the write buffer and complete the current file as it
+        stands, and return the state of this log without its file and
+        buffers.
+
+        >>> import pickle, tempfile
+        >>> from monitor import DRIVER, REQUEST
+        >>> directory = tempfile.mkdtemp()
+        >>> log = ActivityLog(os.path.join(directory, 'log.csv'))
+        >>> log.write(0, DRIVER, REQUEST, 'Ann', Location(0, 0))
+        >>> copy = pickle.loads(pickle.dumps(log))
+        >>> log.write(1, DRIVER, REQUEST, 'Bob', Location(1, 1))
+        >>> copy.write(1, DRIVER, REQUEST, 'Cat', Location(2, 2))
+        >>> log.close()
+        >>> copy.close()
+        >>> for filename in copy.files:
+        ...     with open(filename) as file:
+        ...         header, *rows = file.read().split()
+        ...         print(os.path.basename(filename), rows)
+        log.csv ['0,driver,request,Ann,0,0', '1,driver,request,Bob,1,1']
+        log.1.csv ['1,driver,request,Cat,2,2']
+        >>> import shutil
+        >>> shutil.rmtree(directory)
+        """
+        if self._file is not None and not self._file.closed:
+            self._seal()
+        state = self.__dict__.copy()
+        for name in ('_file', '_text', '_csv', '_binary'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        """Restore this log from <state>, to go on in a new file of its
+        series once it is written to, unless it is rewound first.
+
+        """
+        self.__dict__.update(state)
+        self._file = None
+        self._start_buffers()
+        _logs.add(self)
+
+    def rewind(self) -> None:
+        """Take this log, restored from a pickle, back to the point it was
+        pickled at: truncate the file it was writing then to the size it
+        had, and go on writing that file.
+
+        Only the process that resumes an interrupted run may do this, as
+        anything else still writing the file is overwritten. Files started
+        by the interrupted run after it was pickled are left alone.
+
+        >>> import pickle, tempfile
+        >>> from monitor import DRIVER, REQUEST
+        >>> directory = tempfile.mkdtemp()
+        >>> for format in ('csv', 'binary'):
+        ...     path = os.path.join(directory, 'log.' + format)
+        ...     log = ActivityLog(path, format)
+        ...     log.write(0, DRIVER, REQUEST, 'Ann', Location(0, 0))
+        ...     saved = pickle.dumps(log)
+        ...     log.write(1, DRIVER, REQUEST, 'Bob', Location(1, 1))
+        ...     log._flush()
+        ...     resumed = pickle.loads(saved)
+        ...     resumed.rewind()
+        ...     resumed.write(1, DRIVER, REQUEST, 'Cat', Location(2, 2))
+        ...     resumed.close()
+        ...     if format == 'csv':
+        ...         with open(path) as file:
+        ...             print(file.read().split()[1:])
+        ...     else:
+        ...         print([activity[3] for activity in read_activities(path)])
+        ['0,driver,request,Ann,0,0', '1,driver,request,Cat,2,2']
+        ['Ann', 'Cat']
+        >>> import shutil
+        >>> shutil.rmtree(directory)
+        """
+        self._file = open(self.files[-1], 'r+b', buffering=0)
+        self._file.truncate(self._size)
+        self._file.seek(self._size)
+        # Write the name table and header back at once, so the file stays
+        # readable if the run is interrupted again.
+        self._seal()
+
+    def _start_buffers(self) -> None:
+        """Give this log empty write buffers.
+
+        """
+        self._text = io.StringIO()
+        self._csv = csv.writer(self._text, lineterminator='\n')
+        self._binary = bytearray()
+
+    def _open(self) -> None:
+        """Start the next file of this log.
+
+        Every file after the first is created at the next name of the series
+        that is not taken, so that copies of this log never share a file.
+        """
+        if self.files:
+            root, extension = os.path.splitext(self.path)
+            index = len(self.files)
+            while True:
+                filename = '{}.{}{}'.format(root, index, extension)
+                try:
+                    self._file = open(filename, 'xb', buffering=0)
+                    break
+                except FileExistsError:
+                    index += 1
+        else:
+            filename = self.path
+            self._file = open(filename, 'wb', buffering=0)
+        self.files.append(filename)
+        self._size = 0
+        self._names = {}
+        self._records = 0
+        if self.format == 'binary':
+            self._file.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+            self._size = HEADER.size
+        elif self.format == 'csv':
+            self._csv.writerow(_FIELDS)
+
+    def _finish(self) -> None:
+        """Write out the write buffer and close the current file.
+
+        """
+        self._seal()
+        self._file.close()
+
+    def _seal(self) -> None:
+        """Write out the write buffer, and make the current file complete as
+        it stands: a binary file gets its name table and a header with its
+        record count. Later records are written over the name table.
+
+        """
+        self._flush()
+        if self.format == 'binary':
+            self._file.write('\n'.join(self._names).encode())
+            self._file.truncate()
+            self._file.seek(0)
+            self._file.write(HEADER.pack(MAGIC, VERSION, self._records,
+                                         self._size))
+            self._file.seek(self._size)
+
+    def _detach(self) -> None:
+        """Let go of the current file and the write buffers without writing
+        them, so that a forked copy of this log leaves them to the original.
+
+        """
+        if self._file is not None:
+            # This closes only the copy's descriptor of the file.
+            self._file.close()
+            self._file = None
+        self._start_buffers()
+
+    def _flush(self) -> None:
+        """Write out the write buffer.
+
+        """
+        if self.format == 'binary':
+            data = bytes(self._binary)
+            self._binary.clear()
+        else:
+            data = self._text.getvalue().encode()
+            self._text.seek(0)
+            self._text.truncate()
+        self._file.write(data)
+        self._size += len(data)
+
+    def write(self, timestamp: int, category: str, description: str,
+              identifier: str, location: Location) -> None:
+        """Write an activity to this log.
+
+        >>> import tempfile
+        >>> from monitor import Monitor, DRIVER, RIDER, REQUEST, PICKUP
+        >>> directory = tempfile.mkdtemp()
+        >>> log = ActivityLog(os.path.join(directory, 'log.bin'), 'binary',
+        ...                   max_bytes=64)
+        >>> monitor = Monitor(sink=log)
+        >>> monitor.notify(0, DRIVER, REQUEST, 'Ann', Location(0, 0))
+        >>> monitor.notify(1, RIDER, REQUEST, 'Bob', Location(1, 3))
+        >>> monitor.notify(2, DRIVER, PICKUP, 'Ann', Location(1, 3))
+        >>> log.close()
+        >>> [os.path.basename(filename) for filename in log.files]
+        ['log.bin', 'log.1.bin']
+        >>> for filename in log.files:
+        ...     for activity in read_activities(filename):
+        ...         print(*activity)
+        0 driver request Ann 0 0
+        1 rider request Bob 1 3
+        2 driver pickup Ann 1 3
+        >>> import shutil
+        >>> shutil.rmtree(directory)
+        """
+        if self._file is None:
+            self._open()
+        elif self._size >= self.max_bytes:
+            self._finish()
+            self._open()
+        self.count += 1
+        if self.format == 'binary':
+            names = self._names
+            name = names.get(identifier)
+            if name is None:
+                name = names[identifier] = len(names)
+            self._binary += RECORD.pack(
+                timestamp, _CATEGORY_CODES[category],
+                _DESCRIPTION_CODES[description], name, location.row,
+                location.col)
+            self._records += 1
+            buffered = len(self._binary)
+        else:
+            if self.format == 'csv':
+                self._csv.writerow((timestamp, category, description,
+                                    identifier, location.row, location.col))
+            else:
+                self._text.write(
+                    '{{"time": {}, "category": "{}", "description": "{}", '
+                    '"id": {}, "row": {}, "col": {}}}\n'.format(
+                        timestamp, category, description,
+                        json.dumps(identifier), location.row, location.col))
+            buffered = self._text.tell()
+        if buffered >= self.buffer_bytes or \
+                self._size + buffered >= self.max_bytes:
+            self._flush()
+
+    def close(self) -> None:
+        """Write out everything written to this log, and close its file.
+
+        """
+        if self._file is not None and not self._file.closed:
+            self._finish()
+        _logs.discard(self)
+
+
+def close_all() -> None:
+    """Close every activity log of this process.
+
+    This is done when the interpreter exits, which also closes logs that
+    were restored from a checkpoint by Simulation.resume. fork.branch calls
+    it at the end of each variant, as its process exits without doing so.
+    """
+    for log in list(_logs):
+        log.close()
+
+
+atexit.register(close_all)
+
+
+def _before_fork() -> None:
+    """Write out the write buffer of every open log, so that no activity is
+    left in the buffers a forked process inherits.
+
+    """
+    for log in _logs:
+        if log._file is not None and not log._file.closed:
+            log._flush()
+
+
+def _after_fork_in_child() -> None:
+    """Let every log inherited by a forked process go on in a new file.
+
+    """
+    for log in _logs:
+        log._detach()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=_before_fork,
+                        after_in_child=_after_fork_in_child)
+
+
+def read_activities(filename: str) -> Iterator[
+        Tuple[int, str, str, str, int, int]]:
+    """Yield the time, category, description, identifier, row and column of
+    each activity in the binary activity log file <filename>, in order.
+
+    """
+    with mapped_records(filename, MAGIC, VERSION, RECORD,
+                        'binary activity log') as (names, records):
+        for (timestamp, category, description, name, row,
+             col) in RECORD.iter_unpack(records):
+            yield (timestamp, CATEGORIES[category],
+                   DESCRIPTIONS[description], names[name], row, col)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={'extra-imports': ['atexit', 'csv', 'io', 'json', 'os',
+                                  'struct', 'typing', 'location', 'monitor',
+                                  'tracefile']})
@@ -0,0 +1,390 @@
+"""Benchmarks for the simulation
+
+Run this module to time the core pieces of the simulation on synthetic
+workloads, e.g.
+
+    python benchmark.py queue --events 1000000
+    python benchmark.py run --events 100000 --drivers 5000
+    python benchmark.py parse --events 1000000
+    python benchmark.py load --events 1000000
+    python benchmark.py memory --events 1000000
+    python benchmark.py report --events 1000000
+    python benchmark.py sink --events 1000000
+    python benchmark.py suite --events 1000000 --output results.json
+
+The suite benchmark times parsing, the event loop and the report separately
+on tracegen traces of 10**3 events and up, and writes the results as JSON.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from operator import attrgetter
+from typing import Dict, List
+from activitylog import ActivityLog, FORMATS
+from container import PriorityQueue
+from dispatcher import Dispatcher
+from driver import Driver
+from event import Event, DriverRequest, RiderRequest, create_event_list, \
+    iter_events
+from location import Location
+import monitor
+from monitor import Activity, Monitor, DRIVER, RIDER, REQUEST, PICKUP, \
+    DROPOFF
+from rider import Rider
+from simulation import Simulation
+import tracefile
+from tracegen import City
+
+
+def synthetic_events(n: int, drivers: int = 50, grid: int = 100,
+                     seed: int = 0, surge: int = 1) -> List[Event]:
+    """Return a list of <n> initial events: <drivers> DriverRequests at
+    time 0, followed by RiderRequests arriving <surge> per time unit on a
+    <grid> by <grid> map.
+    """
+    rand = random.Random(seed)
+    events = []
+    for i in range(drivers):
+        location = Location(rand.randint(0, grid), rand.randint(0, grid))
+        events.append(DriverRequest(0, Driver('d{}'.format(i), location,
+                                              rand.randint(1, 3))))
+    for i in range(max(n - drivers, 0)):
+        origin = Location(rand.randint(0, grid), rand.randint(0, grid))
+        destination = Location(rand.randint(0, grid), rand.randint(0, grid))
+        rider = Rider('r{}'.format(i), rand.randint(5, 30), origin,
+                      destination)
+        events.append(RiderRequest(i // surge, rider))
+    return events
+
+
+def write_events(events: List[Event], filename: str) -> None:
+    """Write the DriverRequests and RiderRequests in <events> to <filename>
+    in the format read by create_event_list.
+
+    """
+    with open(filename, 'w') as file:
+        for event in events:
+            if isinstance(event, DriverRequest):
+                driver = event.driver
+                file.write('{} DriverRequest {} {} {}\n'.format(
+                    event.timestamp, driver.id, driver.location,
+                    driver.speed))
+            else:
+                rider = event.rider
+                file.write('{} RiderRequest {} {} {} {}\n'.format(
+                    event.timestamp, rider.id, rider.origin,
+                    rider.destination, rider.patience))
+
+
+def bench_queue(n: int) -> float:
+    """Return the seconds taken to add and then remove <n> events with
+    random timestamps in a PriorityQueue.
+    """
+    rand = random.Random(0)
+    events = [Event(rand.randint(0, n)) for _ in range(n)]
+    queue = PriorityQueue(key=attrgetter('timestamp'))
+    start = time.perf_counter()
+    for event in events:
+        queue.add(event)
+    while not queue.is_empty():
+        queue.remove()
+    return time.perf_counter() - start
+
+
+def bench_run(n: int, drivers: int) -> float:
+    """Return the seconds taken by Simulation.run on a synthetic trace with
+    <n> initial events, <drivers> of which are DriverRequests.
+    """
+    events = synthetic_events(n, drivers)
+    start = time.perf_counter()
+    Simulation().run(events)
+    return time.perf_counter() - start
+
+
+def bench_scheduler(n: int, drivers: int) -> None:
+    """Print the seconds taken by Simulation.run on a synthetic trace with
+    <n> initial events, <drivers> of which are DriverRequests, with each
+    event scheduler.
+
+    """
+    for scheduler in ('heap', 'calendar'):
+        events = synthetic_events(n, drivers)
+        simulation = Simulation(Monitor(history=False), scheduler=scheduler)
+        start = time.perf_counter()
+        simulation.run(events)
+        print('{}: {} events in {:.2f}s'.format(
+            scheduler, n, time.perf_counter() - start))
+
+
+def bench_dispatch(n: int, drivers: int) -> None:
+    """Print the seconds taken by Simulation.run and the average rider wait
+    time on a dense synthetic trace with <n> initial events, <drivers> of
+    which are DriverRequests, with greedy dispatch using each driver lookup
+    and with batched dispatch.
+
+    """
+    for name in ('grid', 'vector', 'batched'):
+        events = synthetic_events(n, drivers, surge=max(drivers // 10, 1))
+        if name == 'batched':
+            dispatcher = Dispatcher(batched=True)
+        else:
+            dispatcher = Dispatcher(lookup=name)
+        simulation = Simulation(dispatcher=dispatcher)
+        start = time.perf_counter()
+        report = simulation.run(events)
+        print('{}: {} events in {:.2f}s, average wait {:.2f}'.format(
+            name, n, time.perf_counter() - start, report['rider_wait_time']))
+
+
+def bench_suite(n: int) -> List[Dict[str, float]]:
+    """Return the seconds taken to parse, run and report on tracegen traces
+    of 10**3, 10**4, ... events, up to <n> events.
+
+    The fleet grows with the trace, and so does the grid, so that the
+    density of drivers stays about the same.
+
+    """
+    results = []
+    size = 1000
+    while size <= n:
+        drivers = max(size // 50, 10)
+        city = City(grid=max(100, int(10 * drivers ** 0.5)), drivers=drivers,
+                    rate=drivers / 25, hotspots=3)
+        handle, filename = tempfile.mkstemp(suffix='.txt')
+        os.close(handle)
+        try:
+            count = city.write(filename, size - drivers)
+            start = time.perf_counter()
+            events = create_event_list(filename)
+            parse = time.perf_counter() - start
+        finally:
+            os.remove(filename)
+        history = Monitor()
+        start = time.perf_counter()
+        Simulation(history).run(events)
+        total = time.perf_counter() - start
+        # Simulation.run ends with a report, so time a second report to
+        # separate the event loop from it.
+        start = time.perf_counter()
+        history.report()
+        report = time.perf_counter() - start
+        results.append({'events': count, 'drivers': drivers,
+                        'parse_seconds': parse,
+                        'run_seconds': total - report,
+                        'report_seconds': report,
+                        'run_events_per_second': count / (total - report)})
+        size *= 10
+    return results
+
+
+def bench_parse(n: int) -> None:
+    """Print the parse throughput, in lines per second, of iter_events and of
+    tracefile.pack_text with and without NumPy, on a synthetic trace file
+    with <n> lines, and check that the converted trace has the same events
+    as iter_events.
+
+    """
+    handle, filename = tempfile.mkstemp(suffix='.txt')
+    os.close(handle)
+    handle, binary = tempfile.mkstemp(suffix='.bin')
+    os.close(handle)
+    try:
+        write_events(synthetic_events(n), filename)
+        start = time.perf_counter()
+        count = sum(1 for _ in iter_events(filename))
+        seconds = time.perf_counter() - start
+        print('iter_events: {} lines in {:.2f}s ({:,.0f} lines/s)'.format(
+            count, seconds, count / seconds))
+        for name, vectorized in (('pack_text', True),
+                                 ('pack_text (per line)', False)):
+            if vectorized and tracefile.numpy is None:
+                continue
+            start = time.perf_counter()
+            size = sum(len(records) for records in tracefile.pack_text(
+                filename, {}, vectorized=vectorized))
+            seconds = time.perf_counter() - start
+            print('{}: {} lines in {:.2f}s ({:,.0f} lines/s)'.format(
+                name, size // tracefile.RECORD.size, seconds,
+                count / seconds))
+        same = tracefile.convert(filename, binary) == count and all(
+            str(converted) == str(event) for converted, event in zip(
+                tracefile.read_events(binary), iter_events(filename)))
+        print('identical events: {}'.format(same))
+    finally:
+        os.remove(filename)
+        os.remove(binary)
+
+
+def bench_load(n: int) -> None:
+    """Print the seconds taken to load a synthetic trace with <n> events into
+    a list with create_event_list, and from a binary trace file.
+
+    """
+    handle, text = tempfile.mkstemp(suffix='.txt')
+    os.close(handle)
+    handle, binary = tempfile.mkstemp(suffix='.bin')
+    os.close(handle)
+    try:
+        write_events(synthetic_events(n), text)
+        tracefile.convert(text, binary)
+        for name, load, filename in (
+                ('create_event_list', create_event_list, text),
+                ('tracefile.read_events', tracefile.read_events, binary)):
+            start = time.perf_counter()
+            count = len(list(load(filename)))
+            seconds = time.perf_counter() - start
+            print('{}: {} events in {:.2f}s ({:,.0f} events/s)'.format(
+                name, count, seconds, count / seconds))
+    finally:
+        os.remove(text)
+        os.remove(binary)
+
+
+class _DictLocation(Location):
+    """A Location with a per-instance __dict__, as before __slots__.
+
+    """
+
+
+class _DictActivity(Activity):
+    """An Activity with a per-instance __dict__, as before __slots__.
+
+    """
+
+
+def bench_memory(n: int) -> None:
+    """Print the bytes allocated per monitor activity, with and without
+    __slots__, when creating <n> activities like Monitor.notify does.
+
+    """
+    for name, activity, location in (('__dict__', _DictActivity,
+                                      _DictLocation),
+                                     ('__slots__', Activity, Location)):
+        tracemalloc.start()
+        activities = [activity(i, PICKUP, 'driver', location(i, i))
+                      for i in range(n)]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print('{}: {:.0f} bytes per activity'.format(name,
+                                                     size / len(activities)))
+
+
+def bench_report(n: int) -> None:
+    """Print the seconds taken by Monitor.report on a history of <n>
+    activities, with NumPy and with the pure Python fallback.
+
+    """
+    rand = random.Random(0)
+    history = Monitor()
+    descriptions = (REQUEST, PICKUP, DROPOFF)
+    for i in range(n):
+        location = Location(rand.randint(0, 100), rand.randint(0, 100))
+        if i % 2:
+            history.notify(i, DRIVER, descriptions[i % 3],
+                           'd{}'.format(i % 5000), location)
+        else:
+            history.notify(i, RIDER, descriptions[i % 3],
+                           'r{}'.format(i // 6), location)
+    numpy = monitor.numpy
+    try:
+        for name in ('numpy', 'python'):
+            if name == 'numpy' and numpy is None:
+                continue
+            monitor.numpy = numpy if name == 'numpy' else None
+            start = time.perf_counter()
+            history.report()
+            print('{}: {} activities in {:.2f}s'.format(
+                name, n, time.perf_counter() - start))
+    finally:
+        monitor.numpy = numpy
+
+
+def bench_sink(n: int) -> None:
+    """Print the time taken per Monitor.notify over <n> activities, without
+    a sink and with an ActivityLog in each format.
+
+    """
+    rand = random.Random(0)
+    descriptions = (REQUEST, PICKUP, DROPOFF)
+    activities = [(i, DRIVER if i % 2 else RIDER, descriptions[i % 3],
+                   'd{}'.format(i % 5000) if i % 2 else 'r{}'.format(i // 6),
+                   Location(rand.randint(0, 100), rand.randint(0, 100)))
+                  for i in range(n)]
+    directory = tempfile.mkdtemp()
+    try:
+        for name in ('none',) + FORMATS:
+            log = None
+            if name != 'none':
+                log = ActivityLog(os.path.join(directory, 'log.' + name),
+                                  name)
+            history = Monitor(history=False, sink=log)
+            start = time.perf_counter()
+            for activity in activities:
+                history.notify(*activity)
+            if log is not None:
+                log.close()
+            seconds = time.perf_counter() - start
+            size = sum(os.path.getsize(filename)
+                       for filename in log.files) if log is not None else 0
+            print('{}: {:.0f} ns per notify, {:.1f} bytes per '
+                  'activity'.format(name, seconds / n * 1e9, size / n))
+    finally:
+        shutil.rmtree(directory)
+
+
+def main() -> None:
+    """Parse the command line and run the requested benchmark.
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('benchmark', choices=['queue', 'run', 'parse',
+                                              'load', 'memory', 'report',
+                                              'dispatch', 'scheduler',
+                                              'suite', 'sink'])
+    parser.add_argument('--events', type=int, default=1000000)
+    parser.add_argument('--drivers', type=int, default=50)
+    parser.add_argument('--output', help='the file to write suite results '
+                        'to, instead of standard output')
+    args = parser.parse_args()
+
+    if args.benchmark == 'parse':
+        bench_parse(args.events)
+    elif args.benchmark == 'load':
+        bench_load(args.events)
+    elif args.benchmark == 'memory':
+        bench_memory(args.events)
+    elif args.benchmark == 'report':
+        bench_report(args.events)
+    elif args.benchmark == 'dispatch':
+        bench_dispatch(args.events, args.drivers)
+    elif args.benchmark == 'scheduler':
+        bench_scheduler(args.events, args.drivers)
+    elif args.benchmark == 'sink':
+        bench_sink(args.events)
+    elif args.benchmark == 'suite':
+        suite = {'python': platform.python_version(),
+                 'numpy': monitor.numpy is not None,
+                 'results': bench_suite(args.events)}
+        if args.output is None:
+            print(json.dumps(suite, indent=2))
+        else:
+            with open(args.output, 'w') as file:
+                json.dump(suite, file, indent=2)
+    else:
+        if args.benchmark == 'queue':
+            seconds = bench_queue(args.events)
+        else:
+            seconds = bench_run(args.events, args.drivers)
+        print('{}: {} events in {:.2f}s ({:,.0f} events/s)'.format(
+            args.benchmark, args.events, seconds, args.events / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,10 @@
 """Containers of objects"""
 
+from collections import OrderedDict, deque
+from heapq import heapify, heappush, heappop
+from typing import Any, Callable, Hashable, Iterable, Iterator, List, \
+    Optional
+
 
 class Container:
     """A container that holds objects.
@@ -35,26 +40,89 @@ class PriorityQueue(Container):
     removed.
 
     Priority is defined by the rich comparison methods for the objects in the
-    container (__lt__, __le__, __gt__, __ge__).
+    container (__lt__, __le__, __gt__, __ge__), or by the value returned by
+    <key> for each object, if a key function is given.
 
     If x < y, then x has a *HIGHER* priority than y.
 
+    If a <dead> function is given, an item for which it returns True is
+    never removed: it is dropped when it reaches the front of the queue, or
+    earlier when the queue is compacted. An item can become dead while it is
+    in the queue.
+
     All objects in the container must be of the same type.
+
+    === Attributes ===
+    dropped: The number of dead items dropped from this queue.
     """
 
+    dropped: int
+
     # === Private Attributes ===
     _items: list
-    #     The items stored in the priority queue.
+    #     A binary heap of (priority, sequence number, item) entries.
+    _key: Optional[Callable[[object], Any]]
+    #     A function returning the priority of an item, or None if items
+    #     are compared directly.
+    _dead: Optional[Callable[[object], bool]]
+    #     A function returning True for items that should be dropped, or
+    #     None if no items are dropped.
+    _counter: int
+    #     The sequence number given to the next item that is added.
+    _compact_at: int
+    #     The size of _items at which dead entries are next removed from it.
     #
     # === Representation Invariants ===
-    # _items is a sorted list, where the first item in the queue is the
-    # item with the highest priority.
+    # _items satisfies the heap property, so _items[0] is the entry with the
+    # highest priority. Sequence numbers are unique and increase in insertion
+    # order, so entries with equal priorities are removed in FIFO order.
 
-    def __init__(self) -> None:
+    def __init__(self, key: Optional[Callable[[object], Any]] = None,
+                 dead: Optional[Callable[[object], bool]] = None) -> None:
         """Initialize an empty PriorityQueue.
 
         """
         self._items = []
+        self._key = key
+        self._dead = dead
+        self._counter = 0
+        self._compact_at = 64
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        """Return the number of items in this PriorityQueue, including dead
+        items that have not been dropped yet.
+
+        """
+        return len(self._items)
+
+    def _prune(self) -> None:
+        """Drop the dead entries at the front of this queue.
+
+        """
+        dead = self._dead
+        items = self._items
+        if dead is not None:
+            while items and dead(items[0][2]):
+                heappop(items)
+                self.dropped += 1
+
+    def _compact(self) -> None:
+        """Drop every dead entry in this queue if it has doubled in size
+        since it was last compacted.
+
+        Compacting takes time linear in the size of the queue, but as the
+        size has doubled since the last compaction this is amortized over
+        the items added in between.
+
+        """
+        dead = self._dead
+        if dead is not None and len(self._items) >= self._compact_at:
+            live = [entry for entry in self._items if not dead(entry[2])]
+            self.dropped += len(self._items) - len(live)
+            heapify(live)
+            self._items = live
+            self._compact_at = max(2 * len(live), 64)
 
     def remove(self) -> object:
         """Remove and return the next item from this PriorityQueue.
@@ -75,7 +143,24 @@ class PriorityQueue(Container):
         >>> pq.remove()
         'yellow'
         """
-        return self._items.pop(0)
+        self._prune()
+        return heappop(self._items)[2]
+
+    def peek(self) -> object:
+        """Return the next item from this PriorityQueue without removing it.
+
+        Precondition: <self> should not be empty.
+
+        >>> pq = PriorityQueue()
+        >>> pq.add("red")
+        >>> pq.add("blue")
+        >>> pq.peek()
+        'blue'
+        >>> pq.remove()
+        'blue'
+        """
+        self._prune()
+        return self._items[0][2]
 
     def is_empty(self) -> bool:
         """
@@ -87,32 +172,422 @@ class PriorityQueue(Container):
         >>> pq.add("thing")
         >>> pq.is_empty()
         False
+        >>> pq = PriorityQueue(dead=lambda item: item.startswith("x"))
+        >>> pq.add("xylophone")
+        >>> pq.is_empty()
+        True
+        >>> pq.dropped
+        1
         """
-        return len(self._items) == 0
+        self._prune()
+        return not self._items
 
     def add(self, item: object) -> None:
         """Add <item> to this PriorityQueue.
 
-        >>> pq = PriorityQueue()
+        >>> pq = PriorityQueue(key=len)
         >>> pq.add("yellow")
         >>> pq.add("blue")
         >>> pq.add("red")
         >>> pq.add("green")
-        >>> pq._items
-        ['blue', 'green', 'red', 'yellow']
+        >>> [pq.remove() for _ in range(4)]
+        ['red', 'blue', 'green', 'yellow']
+        """
+        if self._key is None:
+            priority = item
+        else:
+            priority = self._key(item)
+        heappush(self._items, (priority, self._counter, item))
+        self._counter += 1
+        self._compact()
+
+    def extend(self, items: Iterable[object]) -> None:
+        """Add every item in <items> to this PriorityQueue, in order.
+
+        A large batch is added by rebuilding the heap once, rather than
+        sifting each item into place.
+
+        >>> pq = PriorityQueue(key=len)
+        >>> pq.add("yellow")
+        >>> pq.extend(["blue", "red", "green"])
+        >>> [pq.remove() for _ in range(4)]
+        ['red', 'blue', 'green', 'yellow']
+        """
+        key = self._key
+        start = self._counter
+        entries = [(item if key is None else key(item), start + i, item)
+                   for i, item in enumerate(items)]
+        self._counter += len(entries)
+        if len(entries) * 8 > len(self._items):
+            self._items.extend(entries)
+            heapify(self._items)
+        else:
+            for entry in entries:
+                heappush(self._items, entry)
+        self._compact()
+
+
+class CalendarQueue(Container):
+    """A queue of items with integer priorities, that operates in priority
+    order just like a PriorityQueue.
+
+    Items whose priorities are less than <horizon> ahead of the current
+    priority are kept in a ring of FIFO buckets, one per priority, so adding
+    and removing them takes amortized constant time. Items further ahead
+    wait in an overflow heap, and move into their bucket when the current
+    priority gets close enough.
+
+    Priority is the value returned by <key> for each object, or the object
+    itself if no key function is given, and must be an int. Items are
+    usually added with priorities no lower than the priority of the last
+    item removed, as in a simulation; adding an item with a lower priority
+    is allowed, but takes time linear in the size of the queue.
+
+    As with PriorityQueue, items for which the <dead> function returns True
+    are dropped instead of removed.
+
+    === Attributes ===
+    dropped: The number of dead items dropped from this queue.
+    """
+
+    dropped: int
+
+    # === Private Attributes ===
+    _key: Optional[Callable[[object], int]]
+    #     A function returning the priority of an item, or None if items
+    #     are their own priorities.
+    _dead: Optional[Callable[[object], bool]]
+    #     A function returning True for items that should be dropped, or
+    #     None if no items are dropped.
+    _horizon: int
+    #     The number of buckets.
+    _buckets: List[deque]
+    #     The items with priorities p from _now up to _now + _horizon - 1,
+    #     in bucket p % _horizon, in the order they were added.
+    _now: int
+    #     The priority of the last item removed, which is the lowest
+    #     priority any item can have without rewinding the buckets.
+    _cursor: int
+    #     A priority no higher than that of any item in the queue, and no
+    #     lower than _now. There are no items in the buckets for the
+    #     priorities from _now up to _cursor.
+    _in_buckets: int
+    #     The number of items in the buckets.
+    _overflow: list
+    #     A binary heap of (priority, sequence number, item) entries for the
+    #     items with priorities of at least _now + _horizon.
+    _counter: int
+    #     The sequence number given to the next item put in the overflow.
+    _compact_at: int
+    #     The number of items at which dead items are next removed.
+
+    def __init__(self, key: Optional[Callable[[object], int]] = None,
+                 dead: Optional[Callable[[object], bool]] = None,
+                 horizon: int = 1024) -> None:
+        """Initialize an empty CalendarQueue.
+
+        """
+        self._key = key
+        self._dead = dead
+        self._horizon = horizon
+        self._buckets = [deque() for _ in range(horizon)]
+        self._now = 0
+        self._cursor = 0
+        self._in_buckets = 0
+        self._overflow = []
+        self._counter = 0
+        self._compact_at = 64
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        """Return the number of items in this CalendarQueue, including dead
+        items that have not been dropped yet.
+
+        """
+        return self._in_buckets + len(self._overflow)
+
+    def _insert(self, item: object) -> None:
+        """Put <item> in its bucket, or in the overflow.
+
+        """
+        priority = item if self._key is None else self._key(item)
+        if priority < self._now:
+            self._rewind(priority)
+        if priority < self._now + self._horizon:
+            self._buckets[priority % self._horizon].append(item)
+            self._in_buckets += 1
+        else:
+            heappush(self._overflow, (priority, self._counter, item))
+            self._counter += 1
+        self._cursor = min(self._cursor, priority)
+
+    def _refill(self) -> None:
+        """Move the items in the overflow that are now less than _horizon
+        ahead of _now into their buckets.
+
+        """
+        overflow = self._overflow
+        limit = self._now + self._horizon
+        while overflow and overflow[0][0] < limit:
+            priority, _, item = heappop(overflow)
+            self._buckets[priority % self._horizon].append(item)
+            self._in_buckets += 1
+
+    def _rewind(self, priority: int) -> None:
+        """Make <priority> the current priority, when it is lower than _now.
+
+        Every item in the buckets is moved to the overflow in priority
+        order, and then the buckets are refilled.
+
+        """
+        for tick in range(self._now, self._now + self._horizon):
+            bucket = self._buckets[tick % self._horizon]
+            for item in bucket:
+                self._overflow.append((tick, self._counter, item))
+                self._counter += 1
+            bucket.clear()
+        heapify(self._overflow)
+        self._in_buckets = 0
+        self._now = self._cursor = priority
+        self._refill()
+
+    def _find(self) -> bool:
+        """Move _cursor to the priority of the next item, dropping any dead
+        items in front of it. Return False if this queue is empty.
+
+        Finding the next item does not move _now, so items can still be
+        added with priorities below it without rewinding the buckets.
+
+        """
+        dead = self._dead
+        tick = self._cursor
+        while self._in_buckets:
+            bucket = self._buckets[tick % self._horizon]
+            while bucket:
+                if dead is None or not dead(bucket[0]):
+                    self._cursor = tick
+                    return True
+                bucket.popleft()
+                self._in_buckets -= 1
+                self.dropped += 1
+            tick += 1
+        overflow = self._overflow
+        if dead is not None:
+            while overflow and dead(overflow[0][2]):
+                heappop(overflow)
+                self.dropped += 1
+        if not overflow:
+            return False
+        self._cursor = overflow[0][0]
+        return True
+
+    def _compact(self) -> None:
+        """Drop every dead item in this queue if it has doubled in size
+        since it was last compacted.
+
         """
-        self._items.append(item)
-        self._items.sort()
-        if len(self._items) > 1:
-            i = 0
-            while i < len(self._items) - 1:
-                if self._items[i] == self._items[i + 1]:
-                    if self._items[i] is item:
-                        self._items[i], self._items[i + 1] = \
-                            self._items[i + 1], self._items[i]
-                i += 1
+        dead = self._dead
+        size = self._in_buckets + len(self._overflow)
+        if dead is None or size < self._compact_at:
+            return
+        self._in_buckets = 0
+        for bucket in self._buckets:
+            if bucket:
+                live = [item for item in bucket if not dead(item)]
+                bucket.clear()
+                bucket.extend(live)
+                self._in_buckets += len(live)
+        self._overflow = [entry for entry in self._overflow
+                          if not dead(entry[2])]
+        heapify(self._overflow)
+        self.dropped += size - self._in_buckets - len(self._overflow)
+        self._compact_at = max(
+            2 * (self._in_buckets + len(self._overflow)), 64)
+
+    def add(self, item: object) -> None:
+        """Add <item> to this CalendarQueue.
+
+        >>> cq = CalendarQueue(key=len, horizon=4)
+        >>> for word in ["yellow", "blue", "red", "green", "a", "bee"]:
+        ...     cq.add(word)
+        >>> [cq.remove() for _ in range(6)]
+        ['a', 'red', 'bee', 'blue', 'green', 'yellow']
+        """
+        self._insert(item)
+        self._compact()
+
+    def extend(self, items: Iterable[object]) -> None:
+        """Add every item in <items> to this CalendarQueue, in order.
+
+        >>> cq = CalendarQueue(horizon=2)
+        >>> cq.extend([5, 3, 9])
+        >>> cq.remove()
+        3
+        >>> cq.extend([1, 4])
+        >>> [cq.remove() for _ in range(4)]
+        [1, 4, 5, 9]
+        """
+        for item in items:
+            self._insert(item)
+        self._compact()
+
+    def remove(self) -> object:
+        """Remove and return the next item from this CalendarQueue.
+
+        Precondition: <self> should not be empty.
+
+        >>> cq = CalendarQueue(dead=lambda item: item % 2 == 1)
+        >>> cq.extend([4, 3, 2])
+        >>> cq.remove()
+        2
+        >>> cq.remove()
+        4
+        >>> cq.dropped
+        1
+        """
+        self._find()
+        if self._in_buckets:
+            item = self._buckets[self._cursor % self._horizon].popleft()
+            self._in_buckets -= 1
+        else:
+            item = heappop(self._overflow)[2]
+        self._now = self._cursor
+        self._refill()
+        return item
+
+    def peek(self) -> object:
+        """Return the next item from this CalendarQueue without removing it.
+
+        Precondition: <self> should not be empty.
+
+        >>> cq = CalendarQueue()
+        >>> cq.add(3000)
+        >>> cq.peek()
+        3000
+        """
+        self._find()
+        if self._in_buckets:
+            return self._buckets[self._cursor % self._horizon][0]
+        return self._overflow[0][2]
+
+    def is_empty(self) -> bool:
+        """Return true iff this CalendarQueue is empty.
+
+        >>> cq = CalendarQueue()
+        >>> cq.is_empty()
+        True
+        >>> cq.add(1)
+        >>> cq.is_empty()
+        False
+        """
+        return not self._find()
+
+
+class KeyedQueue(Container):
+    """A first-in, first-out queue of items that can also remove any item
+    by its key.
+
+    Every item in the queue must have a different key. The key of an item is
+    the value returned by <key> for it, or the item itself if no key function
+    is given.
+    """
+
+    # === Private Attributes ===
+    _items: OrderedDict
+    #     The items stored in the queue, by key, in the order they were added.
+    _key: Optional[Callable[[object], Hashable]]
+    #     A function returning the key of an item, or None if items are their
+    #     own keys.
+
+    def __init__(self, key: Optional[Callable[[object], Hashable]] = None) \
+            -> None:
+        """Initialize an empty KeyedQueue.
+
+        """
+        self._items = OrderedDict()
+        self._key = key
+
+    def __len__(self) -> int:
+        """Return the number of items in this KeyedQueue.
+
+        """
+        return len(self._items)
+
+    def __iter__(self) -> Iterator:
+        """Return an iterator over the items in this KeyedQueue, oldest
+        first.
+
+        """
+        return iter(self._items.values())
+
+    def __contains__(self, item: object) -> bool:
+        """Return True iff <item> is in this KeyedQueue.
+
+        """
+        return self._key_of(item) in self._items
+
+    def _key_of(self, item: object) -> Hashable:
+        """Return the key of <item>.
+
+        """
+        if self._key is None:
+            return item
+        return self._key(item)
+
+    def add(self, item: object) -> None:
+        """Add <item> to the back of this KeyedQueue.
+
+        Precondition: no item with the same key is in this KeyedQueue.
+
+        >>> queue = KeyedQueue()
+        >>> queue.add("red")
+        >>> queue.add("blue")
+        >>> list(queue)
+        ['red', 'blue']
+        """
+        self._items[self._key_of(item)] = item
+
+    def remove(self) -> object:
+        """Remove and return the item at the front of this KeyedQueue.
+
+        Precondition: <self> should not be empty.
+
+        >>> queue = KeyedQueue()
+        >>> queue.add("red")
+        >>> queue.add("blue")
+        >>> queue.remove()
+        'red'
+        """
+        return self._items.popitem(last=False)[1]
+
+    def discard(self, item: object) -> None:
+        """Remove <item> from this KeyedQueue, if it is in it.
+
+        >>> queue = KeyedQueue(key=len)
+        >>> queue.add("red")
+        >>> queue.add("blue")
+        >>> queue.add("green")
+        >>> queue.discard("pink")
+        >>> queue.discard("cyan")
+        >>> list(queue)
+        ['red', 'green']
+        """
+        self._items.pop(self._key_of(item), None)
+
+    def is_empty(self) -> bool:
+        """Return True iff this KeyedQueue is empty.
+
+        >>> queue = KeyedQueue()
+        >>> queue.is_empty()
+        True
+        >>> queue.add("thing")
+        >>> queue.is_empty()
+        False
+        """
+        return len(self._items) == 0
 
 
 if __name__ == '__main__':
     import python_ta
-    python_ta.check_all()
+    python_ta.check_all(
+        config={'extra-imports': ['collections', 'heapq', 'typing']})
@@ -1,8 +1,16 @@
 """Dispatcher for the simulation"""
 
-from typing import Optional, List
+from operator import attrgetter
+from typing import Dict, Optional, List, Tuple, Union
+from container import KeyedQueue
 from driver import Driver
 from rider import Rider
+from spatial import FleetArray, GridIndex
+try:
+    import numpy
+    import matching
+except ImportError:  # NumPy is optional; only batched dispatch needs it.
+    numpy = None
 
 
 class Dispatcher:
@@ -20,16 +28,52 @@ class Dispatcher:
     is registered with the dispatcher, and will be used to fulfill future
     rider requests.
 
+    A batched dispatcher never assigns drivers and riders as requests come
+    in. Instead, every request goes on hold until assign_batch is called,
+    which matches as many waiting riders as possible to idle drivers at
+    once, so that the total travel time of the drivers is as low as
+    possible.
+
+    === Public Attributes ===
+    batched: whether requests are held until assign_batch is called.
     """
     drivers: List[Driver]
-    waitlist: List[Rider]
-
-    def __init__(self) -> None:
+    waitlist: KeyedQueue
+    batched: bool
+
+    # === Private Attributes ===
+    _registry: Dict[str, int]
+    #     The position of each registered driver in the registration order,
+    #     by driver identifier.
+    _registrations: int
+    #     The number of times a driver has been registered.
+    _idle_drivers: Dict[str, Driver]
+    #     The idle registered drivers, by identifier.
+    _idle: Union[GridIndex, FleetArray]
+    #     The idle registered drivers, indexed by location.
+
+    def __init__(self, batched: bool = False, lookup: str = 'grid') -> None:
         """Initialize a Dispatcher.
 
+        batched: whether to hold requests until assign_batch is called. This
+            needs NumPy.
+        lookup: how to find the idle driver nearest to a rider. 'grid'
+            searches the cells of a GridIndex around the rider, and
+            'vector' computes the travel time of every idle driver at once
+            with a FleetArray, which needs NumPy.
         """
+        if lookup not in ('grid', 'vector'):
+            raise ValueError("Unknown lookup: {}".format(lookup))
+        if (batched or lookup == 'vector') and numpy is None:
+            raise ImportError("Batched dispatch and vector lookup require "
+                              "NumPy")
+        self.batched = batched
         self.drivers = []
-        self.waitlist = []
+        self.waitlist = KeyedQueue(key=attrgetter('id'))
+        self._registry = {}
+        self._registrations = 0
+        self._idle_drivers = {}
+        self._idle = GridIndex() if lookup == 'grid' else FleetArray()
 
     def __str__(self) -> str:
         """Return a string representation.
@@ -43,24 +87,16 @@ class Dispatcher:
 
         Add the rider to the waiting list if there is no available driver.
 
+        The available driver with the shortest travel time to the rider is
+        chosen. Ties go to the driver who registered first.
+
+        A batched dispatcher always adds the rider to the waiting list.
+
         """
-        count = 0
-        if not self.drivers:
-            self.waitlist.append(rider)
+        if self.batched or not self._idle_drivers:
+            self.waitlist.add(rider)
             return None
-        for driver in self.drivers:
-            if not driver.is_idle:
-                count += 1
-        if count == len(self.drivers):
-            self.waitlist.append(rider)
-            return None
-        best = self.drivers[0]
-        for dr in self.drivers:
-            if dr.is_idle:
-                if dr.get_travel_time(rider.origin) < \
-                        best.get_travel_time(rider.origin):
-                    best = dr
-        return best
+        return self._idle.nearest(rider.origin)
 
     def request_rider(self, driver: Driver) -> Optional[Rider]:
         """Return a rider for the driver, or None if no rider is available.
@@ -68,21 +104,93 @@ class Dispatcher:
         If this is a new driver, register the driver for future rider requests.
 
         """
-        if driver not in self.drivers:
+        if driver.id not in self._registry:
+            self._registry[driver.id] = self._registrations
+            self._registrations += 1
             self.drivers.append(driver)
-        if not self.waitlist:
+            driver.attach(self)
+            self.update_driver(driver)
+        if self.batched or self.waitlist.is_empty():
             return None
         else:
-            return self.waitlist.pop(0)
+            return self.waitlist.remove()
+
+    def update_driver(self, driver: Driver) -> None:
+        """Record that the registered <driver> has become idle or busy.
+
+        """
+        if driver.is_idle:
+            self._idle_drivers[driver.id] = driver
+            self._idle.add(driver, self._registry[driver.id])
+        else:
+            self._idle_drivers.pop(driver.id, None)
+            self._idle.remove(driver)
+
+    def remove_driver(self, driver: Driver) -> None:
+        """Unregister <driver>, who will not be given any more riders unless
+        they request one again.
+
+        """
+        if driver.id in self._registry:
+            del self._registry[driver.id]
+            self._idle_drivers.pop(driver.id, None)
+            self._idle.remove(driver)
+            self.drivers.remove(driver)
+            driver.attach(None)
+
+    def assign_batch(self) -> List[Tuple[Rider, Driver]]:
+        """Match waiting riders to idle drivers, remove the matched riders
+        from the waiting list, and return the (rider, driver) pairs.
+
+        If there are more waiting riders than idle drivers, only the riders
+        who have waited longest are matched. The drivers are chosen to make
+        the total travel time to the riders as low as possible.
+
+        >>> from location import Location
+        >>> dispatcher = Dispatcher(batched=True)
+        >>> for name, col in (('a', 0), ('b', 3)):
+        ...     _ = dispatcher.request_rider(Driver(name, Location(0, col), 1))
+        >>> for name, col in (('r1', 1), ('r2', 0)):
+        ...     dispatcher.request_driver(Rider(name, 5, Location(0, col),
+        ...                                     Location(9, 9)))
+        >>> [(rider.id, driver.id) for rider, driver
+        ...  in dispatcher.assign_batch()]
+        [('r1', 'b'), ('r2', 'a')]
+        """
+        if self.waitlist.is_empty():
+            return []
+        idle = sorted(self._idle_drivers.values(),
+                      key=lambda driver: self._registry[driver.id])
+        count = min(len(self.waitlist), len(idle))
+        if count == 0:
+            return []
+        riders = []
+        for rider in self.waitlist:
+            riders.append(rider)
+            if len(riders) == count:
+                break
+        cost = matching.travel_times(
+            numpy.array([rider.origin.row for rider in riders]),
+            numpy.array([rider.origin.col for rider in riders]),
+            numpy.array([driver.location.row for driver in idle]),
+            numpy.array([driver.location.col for driver in idle]),
+            numpy.array([driver.speed for driver in idle]))
+        pairs = []
+        for rider, column in zip(riders, matching.assign(cost)):
+            self.waitlist.discard(rider)
+            pairs.append((rider, idle[column]))
+        return pairs
 
     def cancel_ride(self, rider: Rider) -> None:
         """Cancel the ride for rider.
 
         """
-        if rider in self.waitlist:
-            self.waitlist.remove(rider)
+        self.waitlist.discard(rider)
 
 
 if __name__ == '__main__':
     import python_ta
-    python_ta.check_all(config={'extra-imports': ['typing', 'driver', 'rider']})
+    python_ta.check_all(
+        config={'extra-imports': ['operator', 'typing', 'container',
+                                  'driver', 'rider', 'spatial', 'numpy',
+                                  'matching']})
@@ -1,5 +1,6 @@
 """Drivers for the simulation"""
 
+from typing import Any, Optional
 from location import Location, manhattan_distance
 from rider import Rider
 
@@ -20,6 +21,14 @@ class Driver:
     passenger: Rider
     destination: Location
 
+    # === Private Attributes ===
+    _dispatcher: Optional[Any]
+    #     The dispatcher this driver is registered with, which is told
+    #     whenever the driver becomes idle or busy, or None.
+
+    __slots__ = ('id', 'location', 'speed', 'is_idle', 'passenger',
+                 'destination', '_dispatcher')
+
     def __init__(self, identifier: str, location: Location, speed: int) -> None:
         """Initialize a Driver.
 
@@ -30,6 +39,7 @@ class Driver:
         self.passenger = None
         self.is_idle = True
         self.destination = None
+        self._dispatcher = None
 
     def __str__(self) -> str:
         """Return a string representation.
@@ -47,6 +57,15 @@ class Driver:
             return self.id == other.id and self.location == other.location \
                 and self.is_idle == other.is_idle
 
+    def attach(self, dispatcher: Any) -> None:
+        """Register this driver with <dispatcher>.
+
+        The dispatcher's update_driver method is called with this driver
+        every time the driver starts or ends a drive.
+
+        """
+        self._dispatcher = dispatcher
+
     def get_travel_time(self, destination: Location) -> int:
         """Return the time it will take to arrive at the destination,
         rounded to the nearest integer.
@@ -63,6 +82,8 @@ class Driver:
         """
         self.is_idle = False
         self.destination = location
+        if self._dispatcher is not None:
+            self._dispatcher.update_driver(self)
         return self.get_travel_time(location)
 
     def end_drive(self) -> None:
@@ -74,6 +95,8 @@ class Driver:
         self.location = self.destination
         self.is_idle = True
         self.destination = None
+        if self._dispatcher is not None:
+            self._dispatcher.update_driver(self)
 
     def start_ride(self, rider: Rider) -> int:
         """Start a ride and return the time the ride will take.
@@ -99,4 +122,4 @@ class Driver:
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(
-        config={'extra-imports': ['location', 'rider']})
+        config={'extra-imports': ['typing', 'location', 'rider']})
@@ -4,7 +4,7 @@ This file should contain all of the classes necessary to model the different
 kinds of events in the simulation.
 """
 from __future__ import annotations
-from typing import List
+from typing import Iterator, List, Optional
 from rider import Rider, WAITING, CANCELLED, SATISFIED
 from dispatcher import Dispatcher
 from driver import Driver
@@ -27,11 +27,18 @@ class Event:
 
     Document any such changes carefully!
 
+    An event that is cancelled while it is waiting in the simulation's event
+    queue is dropped instead of being done.
+
     === Attributes ===
     timestamp: A timestamp for this event.
+    cancelled: True if this event should no longer be done.
     """
 
     timestamp: int
+    cancelled: bool
+
+    __slots__ = ('timestamp', 'cancelled')
 
     def __init__(self, timestamp: int) -> None:
         """Initialize an Event with a given timestamp.
@@ -42,6 +49,17 @@ class Event:
         7
         """
         self.timestamp = timestamp
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        """Mark this event as no longer needing to be done.
+
+        >>> event = Event(7)
+        >>> event.cancel()
+        >>> event.cancelled
+        True
+        """
+        self.cancelled = True
 
     # The following six 'magic methods' are overridden to allow for easy
     # comparison of Event instances. All comparisons simply perform the
@@ -160,6 +178,8 @@ class RiderRequest(Event):
     """
     rider: Rider
 
+    __slots__ = ('rider',)
+
     def __init__(self, timestamp: int, rider: Rider) -> None:
         """Initialize a RiderRequest event.
 
@@ -172,8 +192,9 @@ class RiderRequest(Event):
         If the rider is assigned to a driver, the driver starts driving to
         the rider.
 
-        Return a Cancellation event. If the rider is assigned to a driver,
-        also return a Pickup event.
+        Return a Cancellation event, which is also kept by the rider so that
+        it can be cancelled when the rider is picked up. If the rider is
+        assigned to a driver, also return a Pickup event.
 
         """
         monitor.notify(self.timestamp, RIDER, REQUEST,
@@ -185,8 +206,9 @@ class RiderRequest(Event):
             travel_time = driver.start_drive(self.rider.origin)
             events.append(Pickup(self.timestamp + travel_time,
                                  self.rider, driver))
-        events.append(Cancellation(self.timestamp + int(self.rider.patience),
-                                   self.rider))
+        self.rider.cancellation = Cancellation(
+            self.timestamp + int(self.rider.patience), self.rider)
+        events.append(self.rider.cancellation)
         return events
 
     def __str__(self) -> str:
@@ -206,6 +228,8 @@ class DriverRequest(Event):
 
     driver: Driver
 
+    __slots__ = ('driver',)
+
     def __init__(self, timestamp: int, driver: Driver) -> None:
         """Initialize a DriverRequest event.
 
@@ -251,6 +275,8 @@ class Cancellation(Event):
     """
     rider: Rider
 
+    __slots__ = ('rider',)
+
     def __init__(self, timestamp: int, rider: Rider) -> None:
         """Initialize a cancellation event.
 
@@ -288,6 +314,8 @@ class Pickup(Event):
     rider: Rider
     driver: Driver
 
+    __slots__ = ('rider', 'driver')
+
     def __init__(self, timestamp: int, rider: Rider, driver: Driver) -> None:
         """Initialize a cancellation event.
 
@@ -306,11 +334,17 @@ class Pickup(Event):
         to take place immediately, and the driver has no destination for the
         moment.
 
+        Once the rider is picked up, their cancellation can never happen, so
+        it is cancelled.
+
         """
 
         events = []
         if self.rider.status == WAITING:
             self.rider.status = SATISFIED
+            if self.rider.cancellation is not None:
+                self.rider.cancellation.cancel()
+                self.rider.cancellation = None
             travel_time = self.driver.start_ride(self.rider)
             monitor.notify(self.timestamp, DRIVER, PICKUP,
                            self.driver.id, self.rider.origin)
@@ -342,6 +376,8 @@ class Dropoff(Event):
     rider: Rider
     driver: Driver
 
+    __slots__ = ('rider', 'driver')
+
     def __init__(self, timestamp: int, rider: Rider, driver: Driver) -> None:
         """Initialize a dropoff event.
 
@@ -386,45 +422,88 @@ def create_event_list(filename: str) -> List[Event]:
 
     filename: The name of a file that contains the list of events.
     """
-    events = []
+    return list(iter_events(filename))
+
+
+def iter_events(filename: str) -> Iterator[Event]:
+    """Yield the Events in <filename> one at a time, in the order they appear
+    in the file.
+
+    Only one line of the file is held in memory at a time, so this can be
+    used with Simulation.run to stream traces that are too large to load.
+
+    Precondition: the file stored at <filename> is in the format specified
+    by the assignment handout.
+
+    filename: The name of a file that contains the list of events.
+    """
     with open(filename, "r") as file:
         for line in file:
-            line = line.strip()
-
-            if not line or line.startswith("#"):
-                # Skip lines that are blank or start with #.
-                continue
-
-            # Create a list of words in the line, e.g.
-            # ['10', 'RiderRequest', 'Cerise', '4,2', '1,5', '15'].
-            # Note that these are strings, and you'll need to convert some
-            # of them to a different type.
-            tokens = line.split()
-            timestamp = int(tokens[0])
-            event_type = tokens[1]
-
-            # HINT: Use Location.deserialize to convert the location string to
-            # a location.
-
-            if event_type == "DriverRequest":
-                location = deserialize_location(tokens[3])
-                speed = int(tokens[4])
-                driver = Driver(tokens[2], location, speed)
-                event = DriverRequest(timestamp, driver)
-            elif event_type == "RiderRequest":
-                patience = int(tokens[5])
-                origin = deserialize_location(tokens[3])
-                destination = deserialize_location(tokens[4])
-                rider = Rider(tokens[2], patience, origin, destination)
-                event = RiderRequest(timestamp, rider)
-            events.append(event)
-    return events
+            event = parse_line(line)
+            if event is not None:
+                yield event
+
+
+def parse_line(line: str) -> Optional[Event]:
+    """Return the Event described by one <line> of an event file, or None if
+    the line is blank or a comment.
+
+    Raise ValueError if the line describes an unknown type of event, or is
+    missing any part of its event.
+
+    >>> event = parse_line("10 RiderRequest Cerise 4,2 1,5 15")
+    >>> event.timestamp, event.rider.id, event.rider.patience
+    (10, 'Cerise', 15)
+    >>> parse_line("# a comment") is None
+    True
+    >>> parse_line("10 Bogus Cerise 4,2 1,5 15")
+    Traceback (most recent call last):
+    ...
+    ValueError: Unknown event type: Bogus
+    >>> parse_line("10 RiderRequest Cerise 4,2 1")
+    Traceback (most recent call last):
+    ...
+    ValueError: Malformed event line: 10 RiderRequest Cerise 4,2 1
+    """
+    line = line.strip()
+
+    if not line or line.startswith("#"):
+        # Skip lines that are blank or start with #.
+        return None
+
+    # Create a list of words in the line, e.g.
+    # ['10', 'RiderRequest', 'Cerise', '4,2', '1,5', '15'].
+    # Note that these are strings, and you'll need to convert some
+    # of them to a different type.
+    tokens = line.split()
+    try:
+        timestamp = int(tokens[0])
+        event_type = tokens[1]
+
+        # HINT: Use Location.deserialize to convert the location string to
+        # a location.
+
+        if event_type == "DriverRequest":
+            location = deserialize_location(tokens[3])
+            speed = int(tokens[4])
+            driver = Driver(tokens[2], location, speed)
+            return DriverRequest(timestamp, driver)
+        elif event_type == "RiderRequest":
+            patience = int(tokens[5])
+            origin = deserialize_location(tokens[3])
+            destination = deserialize_location(tokens[4])
+            rider = Rider(tokens[2], patience, origin, destination)
+            return RiderRequest(timestamp, rider)
+    except IndexError:
+        # A missing token, or a location without a comma.
+        raise ValueError("Malformed event line: {}".format(line)) from None
+    raise ValueError("Unknown event type: {}".format(event_type))
 
 
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(
         config={
-            'allowed-io': ['create_event_list'],
+            'allowed-io': ['iter_events'],
             'extra-imports': ['rider', 'dispatcher', 'driver',
                               'location', 'monitor']})
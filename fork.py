@@ -0,0 +1,128 @@
+"""What-if runs branched from one simulated prefix
+
+A simulation is advanced once to the point where the futures to compare
+begin, e.g. just before extra drivers join or a surge of riders arrives,
+and is then branched into many variants. Each variant gets its own copy of
+the simulation, adds its own events, and runs to the end in its own
+process, so the shared prefix is simulated only once.
+
+Where the operating system supports it, each variant process is forked from
+this one, and shares the memory of the advanced simulation until it changes
+it. Elsewhere, the simulation is pickled and sent to each process.
+"""
+
+import multiprocessing
+import os
+import traceback
+from multiprocessing.connection import Connection, wait
+from typing import Dict, List, Optional
+from activitylog import close_all
+from event import Event
+from simulation import Simulation
+
+
+def _variant(connection: Connection, simulation: Simulation,
+             events: List[Event]) -> None:
+    """Run <simulation> to the end with <events> added, and send its report
+    over <connection> once the activity logs of this process are closed.
+
+    What is sent is the report and None, or None and the traceback of the
+    exception the run raised.
+    """
+    try:
+        result = (simulation.run(events), None)
+    except Exception:
+        result = (None, traceback.format_exc())
+    close_all()
+    connection.send(result)
+    connection.close()
+
+
+def branch(simulation: Simulation, variants: List[List[Event]],
+           workers: Optional[int] = None) -> List[Dict[str, float]]:
+    """Return the report of running a copy of <simulation> to the end with
+    each list of events in <variants> added, running at most <workers>
+    variants at a time.
+
+    <simulation> itself is left as it is. The riders and drivers in each
+    variant are new to each copy. Raise a ValueError, before running any
+    variant, if an event is earlier than simulation.now, and a RuntimeError
+    with the traceback of the failure if a variant fails.
+
+    >>> from driver import Driver
+    >>> from event import DriverRequest, create_event_list
+    >>> from location import Location
+    >>> simulation = Simulation()
+    >>> simulation.advance(create_event_list('events.txt'), 10)
+    >>> extra = [DriverRequest(10, Driver('Extra', Location(2, 2), 5))]
+    >>> same, more = branch(simulation, [[], extra], workers=2)
+    >>> same == Simulation().run(create_event_list('events.txt'))
+    True
+    >>> more['rider_wait_time'] <= same['rider_wait_time']
+    True
+    >>> late = [DriverRequest(5, Driver('Late', Location(2, 2), 5))]
+    >>> branch(simulation, [[], late])
+    Traceback (most recent call last):
+    ...
+    ValueError: Variant 1 has an event earlier than 10
+    >>> stuck = [DriverRequest(10, Driver('Stuck', Location(2, 2), 0))]
+    >>> try:
+    ...     branch(simulation, [[], stuck, []], workers=2)
+    ... except RuntimeError as error:
+    ...     lines = str(error).splitlines()
+    ...     print(lines[0], lines[-1])
+    Variant 1 failed: ZeroDivisionError: division by zero
+    """
+    for index, events in enumerate(variants):
+        if any(event.timestamp < simulation.now for event in events):
+            raise ValueError("Variant {} has an event earlier than {}".format(
+                index, simulation.now))
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    reports = [None] * len(variants)
+    waiting = list(enumerate(variants))
+    running = {}
+    try:
+        while waiting or running:
+            while waiting and len(running) < workers:
+                index, events = waiting.pop(0)
+                mine, theirs = context.Pipe(duplex=False)
+                process = context.Process(target=_variant,
+                                          args=(theirs, simulation, events),
+                                          daemon=True)
+                process.start()
+                theirs.close()
+                running[mine] = (index, process)
+            # Collect whichever variants have finished, in any order.
+            for mine in wait(list(running)):
+                index, process = running.pop(mine)
+                try:
+                    reports[index], error = mine.recv()
+                except EOFError:
+                    error = None
+                mine.close()
+                process.join()
+                if error is None and process.exitcode != 0:
+                    error = 'The process exited with code {}'.format(
+                        process.exitcode)
+                if error is not None:
+                    raise RuntimeError('Variant {} failed:\n{}'.format(
+                        index, error.rstrip()))
+    finally:
+        for mine, (_, process) in running.items():
+            process.terminate()
+            process.join()
+            mine.close()
+    return reports
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={'extra-imports': ['multiprocessing', 'os', 'traceback',
+                                  'typing',
+                                  'activitylog', 'event', 'simulation']})
@@ -0,0 +1,521 @@
+"""Live simulation of events fed in as they happen
+
+A Live simulation reads DriverRequest and RiderRequest lines, in the format
+of an event file, from any number of asyncio streams: connections to a TCP
+or Unix socket, or standard input. The simulated clock advances in step with
+the wall clock, sped up by a constant factor, and each event is done at its
+own timestamp or at the current time, whichever is later.
+
+Every activity of the simulation, and rolling statistics of the rides of
+the last few time units, are written back out as JSON lines to every
+connected client, or to standard output when reading standard input. A line
+that is not a valid event is answered with an error line instead of being
+done.
+
+Events are passed from the readers to the simulation through a bounded
+queue. When producers send events faster than the simulation takes them,
+the readers stop reading until there is room again, and the operating
+system pushes back on the producers.
+
+Serve a simulation on a TCP socket, 10 times faster than real time, with
+
+    python live.py --tcp 127.0.0.1:8765 --speed 10
+
+and feed it a synthetic city from another shell with
+
+    python live.py --produce 127.0.0.1:8765 --riders 1000 --speed 10
+
+A socket server finishes the simulation once every client that connected
+has stopped sending, and reading standard input finishes it at the end of
+the input, unless --until stops it sooner.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from typing import Dict, List, Optional, Tuple
+from dispatcher import Dispatcher
+from event import Event, DriverRequest, RiderRequest, parse_line
+from location import Location
+from monitor import Monitor, PERCENTILES
+from simulation import Simulation
+from sketch import Histogram
+from tracegen import City
+
+
+class Live:
+    """A simulation fed with events as they arrive.
+
+    === Attributes ===
+    now: The simulated time. Every event before it has been done.
+    speed: The number of simulated time units per second of wall time.
+    metrics_every: The length of the windows of simulated time whose
+        statistics are reported.
+    """
+    now: int
+    speed: float
+    metrics_every: int
+
+    # === Private Attributes ===
+    _simulation: Simulation
+    #     The simulation the events are fed to.
+    _monitor: Monitor
+    #     The monitor of the simulation, which queues every activity to be
+    #     sent.
+    _inbox: asyncio.Queue
+    #     The events read but not yet given to the simulation.
+    _outbox: List[str]
+    #     The lines written by the simulation but not yet sent.
+    _writers: List[asyncio.StreamWriter]
+    #     The streams the lines are sent to, or anything with the same
+    #     write, drain and is_closing methods.
+    _closed: bool
+    #     True if no more events will be read.
+    _window_start: int
+    #     The simulated time the current window of statistics began at.
+
+    def __init__(self, speed: float = 1.0, capacity: int = 1024,
+                 metrics_every: int = 10,
+                 dispatcher: Optional[Dispatcher] = None) -> None:
+        """Initialize a Live simulation at time 0, which holds at most
+        <capacity> events that have been read but not yet given to the
+        simulation.
+
+        """
+        self.now = 0
+        self.speed = speed
+        self.metrics_every = metrics_every
+        self._monitor = _LiveMonitor(self)
+        self._simulation = Simulation(self._monitor, dispatcher)
+        self._inbox = asyncio.Queue(capacity)
+        self._outbox = []
+        self._writers = []
+        self._closed = False
+        self._window_start = 0
+
+    def queue(self, timestamp: int, category: str, description: str,
+              identifier: str, location: Location) -> None:
+        """Queue an activity of the simulation to be sent.
+
+        """
+        self._outbox.append(json.dumps({
+            'time': timestamp, 'category': category,
+            'description': description, 'id': identifier,
+            'location': str(location)}))
+
+    def subscribe(self, writer: asyncio.StreamWriter) -> None:
+        """Send every line from now on to <writer>.
+
+        """
+        self._writers.append(writer)
+
+    def close(self) -> None:
+        """Stop taking events, so that run finishes the simulation once the
+        events already read have been given to it.
+
+        """
+        self._closed = True
+
+    async def ingest(self, reader: asyncio.StreamReader) -> None:
+        """Read events from <reader> until it ends, waiting whenever the
+        simulation has fallen behind.
+
+        A line that is not a valid event, or is longer than the limit of
+        <reader>, is reported instead of being done. A reader whose
+        connection is lost is treated as ended.
+        """
+        while True:
+            try:
+                line = await reader.readline()
+            except ConnectionError:
+                break
+            except ValueError as error:
+                # The line is over the limit, and what was read of it has
+                # been thrown away.
+                self._error(str(error), '')
+                continue
+            if not line:
+                break
+            text = line.decode(errors='replace')
+            try:
+                event = parse_line(text)
+                if event is not None:
+                    _check(event)
+            except ValueError as error:
+                self._error(str(error), text.strip())
+                continue
+            if event is not None:
+                await self._inbox.put(event)
+
+    def _error(self, message: str, line: str) -> None:
+        """Queue the report of a bad input <line> to be sent.
+
+        """
+        self._outbox.append(json.dumps({'time': self.now, 'error': message,
+                                        'line': line}))
+
+    async def run(self, until: Optional[int] = None
+                  ) -> Optional[Dict[str, float]]:
+        """Advance the simulation in step with the clock until the simulated
+        time <until>, or until this Live simulation is closed and every
+        event read has been given to the simulation. Then finish the
+        simulation, and return its statistics, or None if there are none
+        because no driver or no finished ride was ever seen.
+
+        >>> async def demo():
+        ...     live = Live(speed=1000)
+        ...     reader = asyncio.StreamReader()
+        ...     with open('events.txt') as file:
+        ...         reader.feed_data(file.read().encode())
+        ...     reader.feed_eof()
+        ...     await live.ingest(reader)
+        ...     live.close()
+        ...     return await live.run()
+        >>> from event import create_event_list
+        >>> report = asyncio.run(demo())
+        >>> report == Simulation().run(create_event_list('events.txt'))
+        True
+
+        Lines that are not valid events are reported, and a simulation
+        without events has no statistics.
+
+        >>> async def empty():
+        ...     live = Live(speed=1000)
+        ...     reader = asyncio.StreamReader(limit=32)
+        ...     reader.feed_data(b'1 Bogus \\xff\\n' + b'x' * 40 + b'\\n'
+        ...                      b'0 DriverRequest Amy 1,1 0\\n')
+        ...     reader.feed_eof()
+        ...     await live.ingest(reader)
+        ...     for line in live._outbox:
+        ...         print(json.loads(line)['error'])
+        ...     live.close()
+        ...     return await live.run()
+        >>> print(asyncio.run(empty()))
+        Unknown event type: Bogus
+        Separator is found, but chunk is longer than limit
+        Driver speed must be positive
+        None
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time() - self.now / self.speed
+        next_metrics = self.now + self.metrics_every
+        while until is None or self.now < until:
+            if self._closed and self._inbox.empty():
+                break
+            target = max(int((loop.time() - start) * self.speed), self.now)
+            if until is not None:
+                target = min(target, until)
+            events = []
+            while not self._inbox.empty():
+                events.append(self._take(self._inbox.get_nowait()))
+            self._simulation.advance(events, target)
+            self.now = target
+            if self.now >= next_metrics:
+                self._metrics()
+                next_metrics = self.now + self.metrics_every
+            await self._flush()
+            await asyncio.sleep(1 / self.speed)
+        while not self._inbox.empty():
+            self._simulation.advance([self._take(self._inbox.get_nowait())],
+                                     self.now)
+        report = self._simulation.run([])
+        await self._flush()
+        return report
+
+    def _take(self, event: Event) -> Event:
+        """Return <event>, moved to the current time if it is in the past.
+
+        """
+        event.timestamp = max(event.timestamp, self.now)
+        return event
+
+    def _metrics(self) -> None:
+        """Queue the statistics of the window of time since the last call to
+        be sent, if any rider finished waiting in it, and start a new window.
+
+        """
+        report = self._monitor.window()
+        if report is not None:
+            self._outbox.append(json.dumps({'time': self.now,
+                                            'since': self._window_start,
+                                            'metrics': report}))
+        self._window_start = self.now
+
+    async def _flush(self) -> None:
+        """Send the queued lines to every writer, waiting for any writer
+        that cannot keep up, and forget any writer that has gone away.
+
+        """
+        if not self._outbox:
+            return
+        data = ('\n'.join(self._outbox) + '\n').encode()
+        self._outbox = []
+        for writer in list(self._writers):
+            if writer.is_closing():
+                self._writers.remove(writer)
+                continue
+            try:
+                writer.write(data)
+                await writer.drain()
+            except ConnectionError:
+                self._writers.remove(writer)
+
+
+class _LiveMonitor(Monitor):
+    """A monitor without history that also queues every activity it is
+    notified of to be sent by a Live simulation.
+
+    """
+
+    # === Private Attributes ===
+    _live: Live
+    #     The Live simulation to queue activities in.
+    _window_totals: Tuple[int, int, int, int]
+    #     The total wait time, number of riders counted, total distance and
+    #     ride distance at the start of the current window.
+    _window_waits: Histogram
+    _window_idles: Histogram
+    #     Copies of the wait and idle time histograms at the start of the
+    #     current window.
+
+    def __init__(self, live: Live) -> None:
+        """Initialize a _LiveMonitor for <live>.
+
+        """
+        super().__init__(history=False)
+        self._live = live
+        self._window_totals = (0, 0, 0, 0)
+        self._window_waits = Histogram()
+        self._window_idles = Histogram()
+
+    def notify(self, timestamp: int, category: str, description: str,
+               identifier: str, location: Location) -> None:
+        """Notify the monitor of the activity, and queue it to be sent.
+
+        """
+        super().notify(timestamp, category, description, identifier,
+                       location)
+        self._live.queue(timestamp, category, description, identifier,
+                         location)
+
+    def report(self) -> Optional[Dict[str, float]]:
+        """Return the statistics of the simulation so far, or None if no
+        driver or no finished ride has been seen yet, so that there are no
+        averages to take.
+
+        """
+        if not self._drivers or self._wait_count == 0:
+            return None
+        return super().report()
+
+    def window(self) -> Optional[Dict[str, float]]:
+        """Return the statistics of the activities since the last call, like
+        those of report, and start a new window. Return None if no rider
+        finished waiting in the window.
+
+        The distances are those driven in the window, averaged over every
+        driver seen so far.
+
+        >>> monitor = _LiveMonitor(Live())
+        >>> from monitor import DRIVER, RIDER, REQUEST, PICKUP
+        >>> monitor.notify(0, DRIVER, REQUEST, 'Amy', Location(0, 0))
+        >>> monitor.notify(0, RIDER, REQUEST, 'Bob', Location(0, 2))
+        >>> monitor.notify(2, DRIVER, PICKUP, 'Amy', Location(0, 2))
+        >>> monitor.notify(2, RIDER, PICKUP, 'Bob', Location(0, 2))
+        >>> monitor.window()['rider_wait_time']
+        2.0
+        >>> monitor.window() is None
+        True
+        >>> monitor.notify(3, RIDER, REQUEST, 'Cat', Location(0, 2))
+        >>> monitor.notify(9, RIDER, PICKUP, 'Cat', Location(0, 2))
+        >>> window = monitor.window()
+        >>> window['rider_wait_time'], window['rider_wait_p50']
+        (6.0, 6)
+        >>> monitor.report()['rider_wait_time']
+        4.0
+        """
+        totals = (self._wait_time, self._wait_count, self._total_distance,
+                  self._ride_distance)
+        wait_time, count, total_distance, ride_distance = [
+            now - then for now, then in zip(totals, self._window_totals)]
+        waits = self._wait_times.copy()
+        waits.subtract(self._window_waits)
+        idles = self._idle_times.copy()
+        idles.subtract(self._window_idles)
+        self._window_totals = totals
+        self._window_waits = self._wait_times.copy()
+        self._window_idles = self._idle_times.copy()
+        if count == 0 or not self._drivers:
+            return None
+        report = {"rider_wait_time": wait_time / count,
+                  "driver_total_distance":
+                      total_distance / len(self._drivers),
+                  "driver_ride_distance": ride_distance / len(self._drivers)}
+        for percentile in PERCENTILES:
+            report["rider_wait_p{}".format(percentile)] = \
+                waits.quantile(percentile / 100)
+        for percentile in PERCENTILES:
+            report["driver_idle_p{}".format(percentile)] = \
+                idles.quantile(percentile / 100)
+        return report
+
+
+def _check(event: Event) -> None:
+    """Raise ValueError if <event> has a driver who cannot move or a rider
+    with negative patience, which the simulation cannot do.
+
+    """
+    if isinstance(event, DriverRequest) and event.driver.speed <= 0:
+        raise ValueError("Driver speed must be positive")
+    if isinstance(event, RiderRequest) and event.rider.patience < 0:
+        raise ValueError("Rider patience must not be negative")
+
+
+async def produce(writer: asyncio.StreamWriter, city: City, riders: int,
+                  speed: float) -> None:
+    """Send the lines of a trace of <city> with <riders> riders to <writer>,
+    each at the wall time of its timestamp on a clock sped up by <speed>,
+    until the trace ends or the connection is lost.
+
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    try:
+        for line in city.lines(riders):
+            delay = start + int(line.split(' ', 1)[0]) / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            writer.write((line + '\n').encode())
+            await writer.drain()
+    except ConnectionError:
+        return
+    writer.close()
+    await writer.wait_closed()
+
+
+class _Stdout:
+    """Standard output, with the methods of an asyncio writer used by Live.
+
+    Standard output may be a regular file, which asyncio cannot write to
+    without blocking, so it is written to directly.
+    """
+
+    def write(self, data: bytes) -> None:
+        """Write <data> to standard output.
+
+        """
+        sys.stdout.buffer.write(data)
+
+    async def drain(self) -> None:
+        """Flush standard output.
+
+        """
+        sys.stdout.buffer.flush()
+
+    def is_closing(self) -> bool:
+        """Return False, as standard output stays open.
+
+        """
+        return False
+
+
+async def _stdin() -> asyncio.StreamReader:
+    """Return an asyncio reader for standard input.
+
+    """
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    return reader
+
+
+async def _main(args: argparse.Namespace) -> None:
+    """Run the live simulation or the producer asked for on the command line.
+
+    """
+    if args.produce is not None:
+        host, port = args.produce.rsplit(':', 1)
+        _, writer = await asyncio.open_connection(host, int(port))
+        await produce(writer, City(drivers=args.drivers, rate=args.rate),
+                      args.riders, args.speed)
+        return
+
+    live = Live(args.speed, args.capacity, args.metrics_every)
+
+    connections = []
+    ingesting = set()
+    reading = None
+
+    async def serve(reader: asyncio.StreamReader,
+                    writer: asyncio.StreamWriter) -> None:
+        connections.append(writer)
+        live.subscribe(writer)
+        ingesting.add(reader)
+        try:
+            await live.ingest(reader)
+        finally:
+            ingesting.discard(reader)
+            if not ingesting:
+                # Every client so far has stopped sending events.
+                live.close()
+
+    if args.tcp is not None:
+        host, port = args.tcp.rsplit(':', 1)
+        server = await asyncio.start_server(serve, host, int(port))
+    elif args.unix is not None:
+        server = await asyncio.start_unix_server(serve, args.unix)
+    else:
+        server = None
+        live.subscribe(_Stdout())
+        reader = await _stdin()
+
+        async def read_all() -> None:
+            try:
+                await live.ingest(reader)
+            finally:
+                live.close()
+        # Kept, so that the task is not garbage collected while it runs.
+        reading = asyncio.ensure_future(read_all())
+    try:
+        report = await live.run(args.until)
+    finally:
+        if server is not None:
+            server.close()
+        if reading is not None:
+            reading.cancel()
+            await asyncio.gather(reading, return_exceptions=True)
+        for writer in connections:
+            writer.close()
+        await asyncio.sleep(0)
+    print(json.dumps({'time': live.now, 'report': report}))
+
+
+def main() -> None:
+    """Parse the command line and run the live simulation or producer.
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--tcp', metavar='HOST:PORT',
+                        help='serve on a TCP socket')
+    source.add_argument('--unix', metavar='PATH',
+                        help='serve on a Unix socket')
+    source.add_argument('--produce', metavar='HOST:PORT',
+                        help='send a synthetic trace to a live simulation')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='simulated time units per second')
+    parser.add_argument('--until', type=int, default=None,
+                        help='the simulated time to stop at')
+    parser.add_argument('--capacity', type=int, default=1024,
+                        help='events held before readers wait')
+    parser.add_argument('--metrics-every', type=int, default=10)
+    parser.add_argument('--riders', type=int, default=1000)
+    parser.add_argument('--drivers', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=1.0)
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
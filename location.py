@@ -1,10 +1,19 @@
 """Locations for the simulation"""
 
 from __future__ import annotations
+from functools import lru_cache
+from typing import Any, Tuple
+
+# The number of distinct locations kept by the interning caches.
+CACHE_SIZE = 1 << 16
 
 
 class Location:
     """A two-dimensional location.
+
+    Locations are immutable and hashable, so they can be shared freely and
+    used as dictionary keys or set members.
+
     Attributes:
         row: the row an object is located on
         col: the column an object is located on
@@ -12,12 +21,37 @@ class Location:
     row: int
     col: int
 
+    __slots__ = ('row', 'col')
+
     def __init__(self, row: int, column: int) -> None:
         """Initialize a location.
 
+        >>> location = Location(1, 2)
+        >>> location.row = 3
+        Traceback (most recent call last):
+        ...
+        AttributeError: Location is immutable
+        """
+        object.__setattr__(self, 'row', row)
+        object.__setattr__(self, 'col', column)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        """Prevent changes to this location.
+
+        """
+        raise AttributeError("Location is immutable")
+
+    def __delattr__(self, name: str) -> None:
+        """Prevent changes to this location.
+
+        """
+        raise AttributeError("Location is immutable")
+
+    def __reduce__(self) -> Tuple[Any, Tuple[int, int]]:
+        """Return the information needed to copy or pickle this location.
+
         """
-        self.row = row
-        self.col = column
+        return Location, (self.row, self.col)
 
     def __str__(self) -> str:
         """Return a string representation.
@@ -25,12 +59,28 @@ class Location:
         """
         return str(self.row) + ',' + str(self.col)
 
-    def __eq__(self, other: Location) -> bool:
+    def __eq__(self, other: Any) -> bool:
         """Return True if self equals other, and false otherwise.
 
+        >>> Location(1, 2) == Location(1, 2)
+        True
+        >>> Location(1, 2) == None
+        False
+        >>> Location(1, 2) in {None: 0, (1, 2): 1}
+        False
         """
+        if not isinstance(other, Location):
+            return NotImplemented
         return (self.row == other.row) and (self.col == other.col)
 
+    def __hash__(self) -> int:
+        """Return a hash value for this location.
+
+        >>> hash(Location(1, 2)) == hash(Location(1, 2))
+        True
+        """
+        return hash((self.row, self.col))
+
 
 def manhattan_distance(origin: Location, destination: Location) -> int:
     """Return the Manhattan distance between the origin and the destination.
@@ -41,16 +91,35 @@ def manhattan_distance(origin: Location, destination: Location) -> int:
     return x + y
 
 
+@lru_cache(maxsize=CACHE_SIZE)
+def intern_location(row: int, col: int) -> Location:
+    """Return a Location for (row, col), shared with the other recent
+    callers asking for the same location.
+
+    >>> intern_location(1, 2) is intern_location(1, 2)
+    True
+    """
+    return Location(row, col)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
 def deserialize_location(location_str: str) -> Location:
     """Deserialize a location.
 
+    Repeated strings give the same interned Location object.
+
     location_str: A location in the format 'row,col'
+
+    >>> deserialize_location('1,2') is deserialize_location('1,2')
+    True
+    >>> deserialize_location('1,2') is intern_location(1, 2)
+    True
     """
     data = location_str.split(',')
-    loc = Location(int(data[0]), int(data[1]))
+    loc = intern_location(int(data[0]), int(data[1]))
     return loc
 
 
 if __name__ == '__main__':
     import python_ta
-    python_ta.check_all()
+    python_ta.check_all(config={'extra-imports': ['functools', 'typing']})
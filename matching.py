@@ -0,0 +1,84 @@
+"""Minimum cost matching of riders to drivers
+
+This module needs NumPy.
+"""
+
+import numpy
+
+
+def travel_times(rows: numpy.ndarray, cols: numpy.ndarray,
+                 driver_rows: numpy.ndarray, driver_cols: numpy.ndarray,
+                 speeds: numpy.ndarray) -> numpy.ndarray:
+    """Return the matrix of travel times from every driver to every rider.
+
+    Entry [i, j] is the time driver j takes to drive to rider i, rounded to
+    the nearest integer as in Driver.get_travel_time.
+
+    >>> travel_times(numpy.array([0, 4]), numpy.array([0, 4]),
+    ...              numpy.array([1, 4]), numpy.array([1, 2]),
+    ...              numpy.array([1, 2])).tolist()
+    [[2.0, 3.0], [6.0, 1.0]]
+    """
+    distance = (numpy.abs(rows[:, None] - driver_rows[None, :])
+                + numpy.abs(cols[:, None] - driver_cols[None, :]))
+    return numpy.round(distance / speeds[None, :])
+
+
+def assign(cost: numpy.ndarray) -> numpy.ndarray:
+    """Return the column assigned to each row of the <cost> matrix, so that
+    every row gets a different column and the total cost is as low as
+    possible.
+
+    This is the Hungarian algorithm, with each step over the columns done as
+    one array operation, so it takes O(rows * rows * columns) time.
+
+    Precondition: cost has no more rows than columns.
+
+    >>> assign(numpy.array([[4, 1, 3], [2, 0, 5], [3, 2, 2]])).tolist()
+    [1, 0, 2]
+    >>> assign(numpy.array([[5, 1, 9], [1, 1, 1]])).tolist()
+    [1, 0]
+    """
+    rows, cols = cost.shape
+    # The potentials of the rows and columns, and the row matched to each
+    # column, all indexed from 1 so that column 0 can stand for the row
+    # being added.
+    row_potential = numpy.zeros(rows + 1)
+    col_potential = numpy.zeros(cols + 1)
+    matched = numpy.zeros(cols + 1, dtype=numpy.int64)
+    previous = numpy.zeros(cols + 1, dtype=numpy.int64)
+    for row in range(1, rows + 1):
+        matched[0] = row
+        col = 0
+        slack = numpy.full(cols + 1, numpy.inf)
+        used = numpy.zeros(cols + 1, dtype=bool)
+        while matched[col] != 0:
+            used[col] = True
+            current = matched[col]
+            free = ~used
+            free[0] = False
+            reduced = (cost[current - 1] - row_potential[current]
+                       - col_potential[1:])
+            better = free[1:] & (reduced < slack[1:])
+            slack[1:][better] = reduced[better]
+            previous[1:][better] = col
+            candidates = numpy.where(free, slack, numpy.inf)
+            col = int(numpy.argmin(candidates))
+            delta = candidates[col]
+            row_potential[matched[used]] += delta
+            col_potential[used] -= delta
+            slack[free] -= delta
+        # Flip the alternating path that ends at the free column found.
+        while col != 0:
+            matched[col] = matched[previous[col]]
+            col = previous[col]
+    result = numpy.zeros(rows, dtype=numpy.int64)
+    for col in range(1, cols + 1):
+        if matched[col]:
+            result[matched[col] - 1] = col - 1
+    return result
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={'extra-imports': ['numpy']})
@@ -16,8 +16,17 @@ PICKUP: A constant used for the pickup activity description.
 DROPOFF: A constant used for the dropoff activity description.
 """
 
-from typing import Dict, List
-from location import Location, manhattan_distance
+from __future__ import annotations
+from array import array
+from heapq import merge
+from typing import Any, Dict, Iterator, Optional, Tuple
+from location import Location, intern_location, manhattan_distance
+from sketch import Histogram, exact_quantile
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional; reports fall back to pure Python.
+    numpy = None
 
 RIDER = "rider"
 DRIVER = "driver"
@@ -27,6 +36,16 @@ CANCEL = "cancel"
 PICKUP = "pickup"
 DROPOFF = "dropoff"
 
+# The codes stored for categories and descriptions in a monitor's history.
+CATEGORIES = (RIDER, DRIVER)
+DESCRIPTIONS = (REQUEST, CANCEL, PICKUP, DROPOFF)
+_CATEGORY_CODES = {category: code for code, category in enumerate(CATEGORIES)}
+_DESCRIPTION_CODES = {description: code
+                      for code, description in enumerate(DESCRIPTIONS)}
+
+# The percentiles of rider wait time and driver idle time that are reported.
+PERCENTILES = (50, 95, 99)
+
 
 class Activity:
     """An activity that occurs in the simulation.
@@ -43,6 +62,8 @@ class Activity:
     id: str
     location: Location
 
+    __slots__ = ('time', 'description', 'id', 'location')
+
     def __init__(self, timestamp: int, description: str, identifier: str,
                  location: Location) -> None:
         """Initialize an Activity.
@@ -57,30 +78,101 @@ class Activity:
 class Monitor:
     """A monitor keeps a record of activities that it is notified about.
     When required, it generates a report of the activities it has recorded.
+
+    A monitor with history keeps every activity, in columns of machine
+    integers, and computes its report from them (with NumPy, if it is
+    installed). A monitor without history only keeps running totals and the
+    last activity of each driver, which give the same report in constant
+    time and with memory proportional to the number of drivers and riders.
+
+    Both kinds of monitor also report percentiles of rider wait time and of
+    driver idle time, from histograms with bounded size and relative error.
+    A driver's idle time is the time from one of their requests to their
+    next activity.
     """
 
     # === Private Attributes ===
-    _activities: Dict[str, Dict[str, List[Activity]]]
+    _history: bool
+    #       True iff this monitor keeps every activity.
+    _sink: Optional[Any]
+    #       The object every activity is written to as it happens, or None.
+    _actors: Dict[str, Dict[str, int]]
     #       A dictionary whose key is a category, and value is another
     #       dictionary. The key of the second dictionary is an identifier
-    #       and its value is a list of Activities.
+    #       and its value is the index of that actor in _names. Empty without
+    #       history.
+    _names: list
+    #       The identifier of every actor in the history, by index.
+    _time: array
+    _category: array
+    _description: array
+    _actor: array
+    _row: array
+    _col: array
+    #       The time, category code, description code, actor index and
+    #       location of every activity in the history, in the order this
+    #       monitor was notified of them.
+    _riders: Dict[str, Optional[int]]
+    #       The time of each rider's first activity, or None once their wait
+    #       has been counted.
+    _drivers: Dict[str, Tuple[Optional[Location], str, int]]
+    #       The location, description and time of each driver's last
+    #       activity. The location is None if the driver has since left for
+    #       another monitor.
+    _wait_time: int
+    #       The total wait time of the riders counted in _wait_count.
+    _wait_count: int
+    #       The number of riders that have been picked up or cancelled.
+    _total_distance: int
+    #       The total distance driven by all drivers. Always 0 with history,
+    #       where it is computed from the history instead.
+    _ride_distance: int
+    #       The total distance driven by all drivers on rides. Always 0 with
+    #       history.
+    _wait_times: Histogram
+    #       The wait time of every rider counted in _wait_count.
+    _idle_times: Histogram
+    #       The idle time of every driver request that has been followed by
+    #       another activity of the same driver.
 
-    def __init__(self) -> None:
-        """Initialize a Monitor.
+    def __init__(self, history: bool = True,
+                 sink: Optional[Any] = None) -> None:
+        """Initialize a Monitor, which keeps every activity iff <history> is
+        True.
 
+        sink: An object whose write(timestamp, category, description,
+            identifier, location) method is called with every activity the
+            monitor is notified of, or None. If it also has a rewind method,
+            that is called by rewind_sink.
         """
-        self._activities = {
+        self._history = history
+        self._sink = sink
+        self._actors = {
             RIDER: {},
             DRIVER: {}
         }
-        """@type _activities: dict[str, dict[str, list[Activity]]]"""
+        self._names = []
+        self._time = array('q')
+        self._category = array('b')
+        self._description = array('b')
+        self._actor = array('q')
+        self._row = array('q')
+        self._col = array('q')
+        self._riders = {}
+        self._drivers = {}
+        self._wait_time = 0
+        self._wait_count = 0
+        self._total_distance = 0
+        self._ride_distance = 0
+        self._wait_times = Histogram()
+        self._idle_times = Histogram()
 
     def __str__(self) -> str:
         """Return a string representation.
 
         """
         return "Monitor ({} drivers, {} riders)".format(
-            len(self._activities[DRIVER]), len(self._activities[RIDER]))
+            len(self._drivers), len(self._riders))
 
     def notify(self, timestamp: int, category: str, description: str,
                identifier: str, location: Location) -> None:
@@ -93,63 +185,323 @@ class Monitor:
         identifier: The identifier for the actor.
         location: The location of the activity.
         """
-        if identifier not in self._activities[category]:
-            self._activities[category][identifier] = []
+        if self._history:
+            self._record(timestamp, category, description, identifier,
+                         location)
+            self._update_waits(timestamp, category, description, identifier,
+                               location)
+        else:
+            self._update_totals(timestamp, category, description, identifier,
+                                location)
+        if self._sink is not None:
+            self._sink.write(timestamp, category, description, identifier,
+                             location)
+
+    def _record(self, timestamp: int, category: str, description: str,
+                identifier: str, location: Location) -> None:
+        """Add the activity to the history of this monitor.
+
+        """
+        actors = self._actors[category]
+        if identifier not in actors:
+            actors[identifier] = len(self._names)
+            self._names.append(identifier)
+
+        self._time.append(timestamp)
+        self._category.append(_CATEGORY_CODES[category])
+        self._description.append(_DESCRIPTION_CODES[description])
+        self._actor.append(actors[identifier])
+        self._row.append(location.row)
+        self._col.append(location.col)
+
+    def rewind_sink(self) -> None:
+        """Take the sink of this monitor, restored from a checkpoint, back to
+        where it was when the checkpoint was saved, if it can be.
+
+        """
+        rewind = getattr(self._sink, 'rewind', None)
+        if rewind is not None:
+            rewind()
+
+    def hand_off(self, identifier: str) -> None:
+        """Record that the driver <identifier> has left for an area recorded
+        by another monitor, which will be merged with this one.
+
+        Their next activity recorded by this monitor, if any, starts a new
+        stretch of driving, since the distance driven in between is recorded
+        by the other monitor.
+        """
+        if identifier in self._drivers:
+            _, description, timestamp = self._drivers[identifier]
+            self._drivers[identifier] = (None, description, timestamp)
+
+    def merge(self, other: Monitor) -> None:
+        """Add the activities recorded by <other> to this monitor, as if this
+        monitor had been notified of them too.
+
+        The two monitors may have seen activities of the same driver, as long
+        as all of the driver's activities in one monitor happened before
+        those in the other.
+
+        Precondition: other keeps history iff this monitor does.
+
+        >>> first, second, both = Monitor(), Monitor(), Monitor()
+        >>> for monitor in (first, both):
+        ...     monitor.notify(0, DRIVER, REQUEST, 'Ann', Location(0, 0))
+        ...     monitor.notify(2, DRIVER, PICKUP, 'Ann', Location(0, 2))
+        >>> for monitor in (second, both):
+        ...     monitor.notify(1, DRIVER, REQUEST, 'Cat', Location(5, 5))
+        ...     monitor.notify(3, DRIVER, DROPOFF, 'Ann', Location(1, 3))
+        ...     monitor.notify(4, RIDER, REQUEST, 'Bob', Location(1, 3))
+        ...     monitor.notify(5, RIDER, CANCEL, 'Bob', Location(1, 3))
+        >>> first.merge(second)
+        >>> first.report() == both.report()
+        True
+        """
+        self._wait_time += other._wait_time
+        self._wait_count += other._wait_count
+        self._total_distance += other._total_distance
+        self._ride_distance += other._ride_distance
+        self._wait_times.merge(other._wait_times)
+        self._idle_times.merge(other._idle_times)
+        self._riders.update(other._riders)
+        for identifier, last in other._drivers.items():
+            mine = self._drivers.get(identifier)
+            if mine is None or mine[2] <= last[2]:
+                self._drivers[identifier] = last
+        if self._history:
+            # Rebuild the history with both monitors' activities in time
+            # order. Activities at the same time keep this monitor's first.
+            activities = list(merge(self.activities(), other.activities(),
+                                    key=lambda pair: pair[1].time))
+            mine = Monitor()
+            for category, activity in activities:
+                mine._record(activity.time, category, activity.description,
+                             activity.id, activity.location)
+            self._actors = mine._actors
+            self._names = mine._names
+            self._time, self._category = mine._time, mine._category
+            self._description, self._actor = mine._description, mine._actor
+            self._row, self._col = mine._row, mine._col
+
+    def activities(self) -> Iterator[Tuple[str, Activity]]:
+        """Yield the category and an Activity for every activity in the
+        history of this monitor, in the order the monitor was notified of
+        them.
+
+        >>> monitor = Monitor()
+        >>> monitor.notify(0, DRIVER, REQUEST, 'Ann', Location(0, 0))
+        >>> [(category, activity.id, str(activity.location))
+        ...  for category, activity in monitor.activities()]
+        [('driver', 'Ann', '0,0')]
+        """
+        for i in range(len(self._time)):
+            yield (CATEGORIES[self._category[i]],
+                   Activity(self._time[i],
+                            DESCRIPTIONS[self._description[i]],
+                            self._names[self._actor[i]],
+                            intern_location(self._row[i], self._col[i])))
+
+    def _update_rider(self, timestamp: int, identifier: str) -> None:
+        """Add the activity of the rider <identifier> at <timestamp> to the
+        wait times of this monitor.
+
+        """
+        if identifier not in self._riders:
+            self._riders[identifier] = timestamp
+        elif self._riders[identifier] is not None:
+            # The second activity is PICKUP or CANCEL, and ends the wait.
+            wait_time = timestamp - self._riders[identifier]
+            self._wait_time += wait_time
+            self._wait_count += 1
+            self._wait_times.add(wait_time)
+            self._riders[identifier] = None
+
+    def _update_waits(self, timestamp: int, category: str, description: str,
+                      identifier: str, location: Location) -> None:
+        """Add the activity to the wait and idle time histograms of this
+        monitor, which with history are the only running totals kept.
+
+        """
+        if category == RIDER:
+            self._update_rider(timestamp, identifier)
+        else:
+            last = self._drivers.get(identifier)
+            if last is not None and last[0] is not None and \
+                    last[1] == REQUEST:
+                self._idle_times.add(timestamp - last[2])
+            self._drivers[identifier] = (location, description, timestamp)
 
-        activity = Activity(timestamp, description, identifier, location)
-        self._activities[category][identifier].append(activity)
+    def _update_totals(self, timestamp: int, category: str, description: str,
+                       identifier: str, location: Location) -> None:
+        """Add the activity to the running totals of this monitor.
+
+        """
+        if category == RIDER:
+            self._update_rider(timestamp, identifier)
+        else:
+            if identifier in self._drivers and \
+                    self._drivers[identifier][0] is not None:
+                last_location, last_description, last_time = \
+                    self._drivers[identifier]
+                distance = manhattan_distance(last_location, location)
+                self._total_distance += distance
+                if last_description == PICKUP:
+                    self._ride_distance += distance
+                elif last_description == REQUEST:
+                    self._idle_times.add(timestamp - last_time)
+            self._drivers[identifier] = (location, description, timestamp)
 
     def report(self) -> Dict[str, float]:
         """Return a report of the activities that have occurred.
 
-        """
-        return {"rider_wait_time": self._average_wait_time(),
-                "driver_total_distance": self._average_total_distance(),
-                "driver_ride_distance": self._average_ride_distance()}
+        >>> history = Monitor()
+        >>> totals = Monitor(history=False)
+        >>> for monitor in (history, totals):
+        ...     monitor.notify(0, DRIVER, REQUEST, 'Ann', Location(0, 0))
+        ...     monitor.notify(1, RIDER, REQUEST, 'Bob', Location(2, 1))
+        ...     monitor.notify(4, DRIVER, PICKUP, 'Ann', Location(2, 1))
+        ...     monitor.notify(4, RIDER, PICKUP, 'Bob', Location(2, 1))
+        ...     monitor.notify(6, DRIVER, DROPOFF, 'Ann', Location(2, 3))
+        ...     monitor.notify(6, RIDER, DROPOFF, 'Bob', Location(2, 3))
+        >>> history.report() == totals.report()
+        True
+        >>> report = totals.report()
+        >>> report['rider_wait_time'], report['driver_total_distance']
+        (3.0, 5.0)
+        >>> report['rider_wait_p50'], report['driver_idle_p99']
+        (3, 4)
+
+        The percentiles match the exact ones on the sample traces:
+
+        >>> from event import create_event_list
+        >>> from simulation import Simulation
+        >>> for filename in ('events.txt', 'events2.txt', 'events3.txt',
+        ...                  'events_small.txt'):
+        ...     monitor = Monitor()
+        ...     report = Simulation(monitor).run(create_event_list(filename))
+        ...     exact = monitor._exact_percentiles()
+        ...     print(all(report[key] == exact[key] for key in exact))
+        True
+        True
+        True
+        True
 
-    def _average_wait_time(self) -> float:
-        """Return the average wait time of riders that have either been picked
-        up or have cancelled their ride.
+        Larger values share histogram buckets, so their percentiles can be
+        below the exact ones, but by at most a fraction 2 ** -7, the
+        precision of the histograms:
 
+        >>> import random
+        >>> rand = random.Random(0)
+        >>> monitor = Monitor()
+        >>> for i in range(1000):
+        ...     rider, driver = 'r{}'.format(i), 'd{}'.format(i)
+        ...     monitor.notify(0, RIDER, REQUEST, rider, Location(0, 0))
+        ...     monitor.notify(rand.randint(0, 10 ** 6), RIDER, PICKUP, rider,
+        ...                    Location(0, 0))
+        ...     monitor.notify(0, DRIVER, REQUEST, driver, Location(0, 0))
+        ...     monitor.notify(rand.randint(0, 10 ** 6), DRIVER, PICKUP,
+        ...                    driver, Location(0, 0))
+        >>> report = monitor.report()
+        >>> exact = monitor._exact_percentiles()
+        >>> all(exact[key] * (1 - 2 ** -7) <= report[key] <= exact[key]
+        ...     for key in exact)
+        True
+        >>> all(report[key] != exact[key] for key in exact)
+        True
         """
-        wait_time = 0
-        count = 0
-        for activities in self._activities[RIDER].values():
-            # A rider that has less than two activities hasn't finished
-            # waiting (they haven't cancelled or been picked up).
-            if len(activities) >= 2:
-                # The first activity is REQUEST, and the second is PICKUP
-                # or CANCEL. The wait time is the difference between the two.
-                wait_time += activities[1].time - activities[0].time
-                count += 1
-        return wait_time / count
-
-    def _average_total_distance(self) -> float:
-        """Return the average distance drivers have driven.
+        if not self._history:
+            report = {"rider_wait_time": self._wait_time / self._wait_count,
+                      "driver_total_distance":
+                          self._total_distance / len(self._drivers),
+                      "driver_ride_distance":
+                          self._ride_distance / len(self._drivers)}
+        elif numpy is not None:
+            report = self._vectorized_report()
+        else:
+            # Replay the history through the running totals instead.
+            totals = Monitor(history=False)
+            for category, activity in self.activities():
+                totals.notify(activity.time, category, activity.description,
+                              activity.id, activity.location)
+            report = totals.report()
+        for percentile in PERCENTILES:
+            report["rider_wait_p{}".format(percentile)] = \
+                self._wait_times.quantile(percentile / 100)
+        for percentile in PERCENTILES:
+            report["driver_idle_p{}".format(percentile)] = \
+                self._idle_times.quantile(percentile / 100)
+        return report
+
+    def _exact_percentiles(self) -> Dict[str, float]:
+        """Return the exact percentiles of rider wait time and driver idle
+        time, computed from the history of this monitor.
 
         """
-        dist = 0
-        count = 0
-        for activities in self._activities[DRIVER].values():
-            for i in range(len(activities) - 1):
-                dist += (manhattan_distance(activities[i].location,
-                                            activities[i + 1].location))
-            count += 1
-        return dist / count
-
-    def _average_ride_distance(self) -> float:
-        """Return the average distance drivers have driven on rides.
+        waits = []
+        idles = []
+        firsts = {}
+        requests = {}
+        for category, activity in self.activities():
+            if category == RIDER:
+                if activity.id not in firsts:
+                    firsts[activity.id] = activity.time
+                elif firsts[activity.id] is not None:
+                    waits.append(activity.time - firsts[activity.id])
+                    firsts[activity.id] = None
+            else:
+                if requests.get(activity.id) is not None:
+                    idles.append(activity.time - requests[activity.id])
+                if activity.description == REQUEST:
+                    requests[activity.id] = activity.time
+                else:
+                    requests[activity.id] = None
+        percentiles = {}
+        for percentile in PERCENTILES:
+            percentiles["rider_wait_p{}".format(percentile)] = \
+                exact_quantile(waits, percentile / 100)
+            percentiles["driver_idle_p{}".format(percentile)] = \
+                exact_quantile(idles, percentile / 100)
+        return percentiles
+
+    def _vectorized_report(self) -> Dict[str, float]:
+        """Return a report of the activities in the history of this monitor,
+        computed with NumPy array operations.
 
         """
-        dist = 0
-        count = 0
-        for activities in self._activities[DRIVER].values():
-            for i in range(len(activities) - 1):
-                if activities[i].description == PICKUP:
-                    dist += manhattan_distance(activities[i].location,
-                                               activities[i + 1].location)
-            count += 1
-        return dist / count
+        time = numpy.frombuffer(self._time, dtype=numpy.int64)
+        category = numpy.frombuffer(self._category, dtype=numpy.int8)
+        description = numpy.frombuffer(self._description, dtype=numpy.int8)
+        actor = numpy.frombuffer(self._actor, dtype=numpy.int64)
+        row = numpy.frombuffer(self._row, dtype=numpy.int64)
+        col = numpy.frombuffer(self._col, dtype=numpy.int64)
+
+        # Group the activities of each rider together, keeping them in order.
+        riders = numpy.flatnonzero(category == _CATEGORY_CODES[RIDER])
+        riders = riders[numpy.argsort(actor[riders], kind='stable')]
+        starts = numpy.flatnonzero(numpy.diff(actor[riders], prepend=-1))
+        sizes = numpy.diff(starts, append=len(riders))
+        # A rider that has less than two activities hasn't finished waiting.
+        # Otherwise their wait ends with their second activity.
+        firsts = riders[starts[sizes >= 2]]
+        seconds = riders[starts[sizes >= 2] + 1]
+        wait_time = int((time[seconds] - time[firsts]).sum())
+
+        # Group the activities of each driver together, and find the
+        # distance between each activity and the next one by the same driver.
+        drivers = numpy.flatnonzero(category == _CATEGORY_CODES[DRIVER])
+        drivers = drivers[numpy.argsort(actor[drivers], kind='stable')]
+        same = actor[drivers][1:] == actor[drivers][:-1]
+        distance = (numpy.abs(numpy.diff(row[drivers]))
+                    + numpy.abs(numpy.diff(col[drivers])))
+        total_distance = int(distance[same].sum())
+        on_ride = description[drivers][:-1] == _DESCRIPTION_CODES[PICKUP]
+        ride_distance = int(distance[same & on_ride].sum())
+
+        count = len(self._actors[DRIVER])
+        return {"rider_wait_time": wait_time / len(firsts),
+                "driver_total_distance": total_distance / count,
+                "driver_ride_distance": ride_distance / count}
 
 
 if __name__ == "__main__":
@@ -157,4 +509,5 @@ if __name__ == "__main__":
     python_ta.check_all(
         config={
             'max-args': 6,
-            'extra-imports': ['typing', 'location']})
+            'extra-imports': ['array', 'heapq', 'typing', 'location',
+                              'sketch', 'numpy']})
@@ -0,0 +1,230 @@
+"""Spatially partitioned simulation
+
+A partitioned simulation splits the map into vertical strips of columns,
+called regions, and simulates each region in its own process, with its own
+Dispatcher, event queue and Monitor. Riders are served by the drivers in the
+region they request a ride from. A driver who drops a rider off in another
+region is handed off to that region, where they request their next rider.
+
+The regions are kept in step by conservative time windows. A coordinator
+lets every region simulate the events before the end of the current window,
+then delivers the drivers handed off during it, who request a rider at the
+start of the next window. A wider window means fewer round trips between
+processes, but handed off drivers may wait up to a window longer than they
+would in a single simulation.
+
+With a single region there are no handoffs, and the result is exactly that
+of Simulation.run.
+"""
+
+from __future__ import annotations
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Connection
+from operator import attrgetter
+from typing import Dict, List, Optional, Tuple
+from container import PriorityQueue
+from dispatcher import Dispatcher
+from driver import Driver
+from event import Event, DriverRequest
+from location import Location
+from monitor import Monitor
+
+# A driver handed off to another region: the time of their request, and
+# their identifier, location and speed.
+Handoff = Tuple[int, str, Location, int]
+
+
+class Partitioning:
+    """A division of the map into regions of equal width.
+
+    === Attributes ===
+    regions: The number of regions.
+    low: The lowest column in the first region. Lower columns are in it too.
+    width: The number of columns covered by all the regions together.
+        Higher columns are in the last region.
+    """
+
+    regions: int
+    low: int
+    width: int
+
+    def __init__(self, regions: int, low: int, high: int) -> None:
+        """Initialize a Partitioning of the columns from <low> to <high>
+        into <regions> regions.
+
+        """
+        self.regions = regions
+        self.low = low
+        self.width = high - low + 1
+
+    def region(self, location: Location) -> int:
+        """Return the region that contains <location>.
+
+        >>> partitioning = Partitioning(2, 0, 9)
+        >>> [partitioning.region(Location(0, col)) for col in (-3, 4, 5, 99)]
+        [0, 0, 1, 1]
+        """
+        region = (location.col - self.low) * self.regions // self.width
+        return min(max(region, 0), self.regions - 1)
+
+
+def initial_location(event: Event) -> Location:
+    """Return the location of the driver or rider making the request
+    <event>.
+
+    """
+    if isinstance(event, DriverRequest):
+        return event.driver.location
+    return event.rider.origin
+
+
+class Region:
+    """The part of a partitioned simulation that runs in one process.
+
+    === Attributes ===
+    index: The region this simulates.
+    partitioning: The partitioning this region belongs to.
+    monitor: The monitor of this region.
+    """
+
+    index: int
+    partitioning: Partitioning
+    monitor: Monitor
+
+    # === Private Attributes ===
+    _events: PriorityQueue
+    #     The pending events in this region.
+    _dispatcher: Dispatcher
+    #     The dispatcher of this region.
+
+    def __init__(self, index: int, partitioning: Partitioning,
+                 events: List[Event], monitor: Monitor) -> None:
+        """Initialize a Region with its initial <events>.
+
+        """
+        self.index = index
+        self.partitioning = partitioning
+        self._events = PriorityQueue(key=attrgetter('timestamp'),
+                                     dead=attrgetter('cancelled'))
+        self._dispatcher = Dispatcher()
+        self.monitor = monitor
+        for event in events:
+            self._events.add(event)
+
+    def next_timestamp(self) -> Optional[int]:
+        """Return the timestamp of the next pending event in this region, or
+        None if there is none.
+
+        """
+        if self._events.is_empty():
+            return None
+        return self._events.peek().timestamp
+
+    def advance(self, until: int, arrivals: List[Handoff]) -> List[Handoff]:
+        """Add a DriverRequest for each driver in <arrivals>, then do every
+        pending event before <until>.
+
+        Return the drivers that have left this region.
+        """
+        for timestamp, identifier, location, speed in arrivals:
+            self._events.add(DriverRequest(
+                timestamp, Driver(identifier, location, speed)))
+        departures = []
+        while not self._events.is_empty() and \
+                self._events.peek().timestamp < until:
+            event = self._events.remove()
+            for spawned in event.do(self._dispatcher, self.monitor):
+                if isinstance(spawned, DriverRequest) and \
+                        self.partitioning.region(spawned.driver.location) \
+                        != self.index:
+                    driver = spawned.driver
+                    self._dispatcher.remove_driver(driver)
+                    self.monitor.hand_off(driver.id)
+                    departures.append((spawned.timestamp, driver.id,
+                                       driver.location, driver.speed))
+                else:
+                    self._events.add(spawned)
+        return departures
+
+
+def _serve(connection: Connection, region: Region) -> None:
+    """Run <region> in this process, following the commands sent over
+    <connection> by the coordinator.
+
+    """
+    connection.send(region.next_timestamp())
+    while True:
+        command = connection.recv()
+        if command is None:
+            break
+        until, arrivals = command
+        departures = region.advance(until, arrivals)
+        connection.send((departures, region.next_timestamp()))
+    connection.send(region.monitor)
+    connection.close()
+
+
+def run(initial_events: List[Event], regions: int, window: int = 1,
+        history: bool = True) -> Dict[str, float]:
+    """Run a simulation of <initial_events> split into <regions> regions,
+    each in its own process, synchronized every <window> time units.
+
+    Return the report of all the regions' monitors merged together. The
+    monitors keep every activity iff <history> is True.
+
+    >>> from event import create_event_list
+    >>> from simulation import Simulation
+    >>> events = create_event_list('events.txt')
+    >>> run(events, 1) == Simulation().run(create_event_list('events.txt'))
+    True
+    >>> run(events, 3)['rider_wait_time']
+    0.5
+    """
+    cols = [initial_location(event).col for event in initial_events]
+    partitioning = Partitioning(regions, min(cols, default=0),
+                                max(cols, default=0))
+    shares = [[] for _ in range(regions)]
+    for event in initial_events:
+        shares[partitioning.region(initial_location(event))].append(event)
+
+    connections = []
+    processes = []
+    for index in range(regions):
+        mine, theirs = Pipe()
+        region = Region(index, partitioning, shares[index],
+                        Monitor(history))
+        process = Process(target=_serve, args=(theirs, region), daemon=True)
+        process.start()
+        connections.append(mine)
+        processes.append(process)
+
+    next_timestamps = [connection.recv() for connection in connections]
+    arrivals = [[] for _ in range(regions)]
+    pending = [timestamp for timestamp in next_timestamps
+               if timestamp is not None]
+    while pending:
+        until = min(pending) + window
+        for connection, mine in zip(connections, arrivals):
+            connection.send((until, mine))
+        arrivals = [[] for _ in range(regions)]
+        pending = []
+        for connection in connections:
+            departures, next_timestamp = connection.recv()
+            for _, identifier, location, speed in departures:
+                # The driver requests a rider in their new region at the
+                # start of the next window.
+                arrivals[partitioning.region(location)].append(
+                    (until, identifier, location, speed))
+                pending.append(until)
+            if next_timestamp is not None:
+                pending.append(next_timestamp)
+
+    monitor = None
+    for connection, process in zip(connections, processes):
+        connection.send(None)
+        if monitor is None:
+            monitor = connection.recv()
+        else:
+            monitor.merge(connection.recv())
+        process.join()
+    return monitor.report()
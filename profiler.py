@@ -0,0 +1,242 @@
+"""Profiling of simulation runs
+
+A Profiler passed to a Simulation records where the run spends its time:
+how many events of each class were done and how long they took, how deep
+the event queue was at each timestamp, and how long the dispatcher and the
+monitor took. A Simulation without a profiler does none of this work.
+"""
+
+from array import array
+from time import perf_counter_ns
+from typing import Any, Dict, List, Optional
+from dispatcher import Dispatcher
+from driver import Driver
+from location import Location
+from monitor import Monitor
+from rider import Rider
+
+
+class Profiler:
+    """A record of where the time in simulation runs went.
+
+    === Attributes ===
+    counts: The number of events of each class that were done, by class
+        name.
+    nanoseconds: The total time taken to do the events of each class, by
+        class name. This includes the time taken by the dispatcher and the
+        monitor during the events.
+    lookups: The number of times the dispatcher was asked for a driver, a
+        rider or a batch of matches.
+    lookup_nanoseconds: The total time the dispatcher took to answer.
+    notifications: The number of activities the monitor was notified of.
+    notify_nanoseconds: The total time the monitor took to record them.
+    dropped: The number of cancelled events dropped from the event queue,
+        or skipped after being taken from it.
+    """
+    counts: Dict[str, int]
+    nanoseconds: Dict[str, int]
+    lookups: int
+    lookup_nanoseconds: int
+    notifications: int
+    notify_nanoseconds: int
+    dropped: int
+
+    # === Private Attributes ===
+    _times: array
+    #     The timestamps at which the depth of the event queue was sampled.
+    _depths: array
+    #     The depth of the event queue at each sampled timestamp.
+
+    def __init__(self) -> None:
+        """Initialize an empty Profiler.
+
+        """
+        self.counts = {}
+        self.nanoseconds = {}
+        self.lookups = 0
+        self.lookup_nanoseconds = 0
+        self.notifications = 0
+        self.notify_nanoseconds = 0
+        self.dropped = 0
+        self._times = array('q')
+        self._depths = array('q')
+
+    def do(self, event: Any, dispatcher: Dispatcher,
+           monitor: Monitor) -> List[Any]:
+        """Do <event>, recording the time it takes, and return the events it
+        returns.
+
+        """
+        start = perf_counter_ns()
+        future = event.do(dispatcher, monitor)
+        elapsed = perf_counter_ns() - start
+        name = type(event).__name__
+        if name in self.counts:
+            self.counts[name] += 1
+            self.nanoseconds[name] += elapsed
+        else:
+            self.counts[name] = 1
+            self.nanoseconds[name] = elapsed
+        return future
+
+    def sample(self, timestamp: int, depth: int) -> None:
+        """Record that the event queue held <depth> events at <timestamp>.
+
+        """
+        self._times.append(timestamp)
+        self._depths.append(depth)
+
+    def report(self) -> Dict[str, Any]:
+        """Return a report of everything recorded, as nested dictionaries and
+        lists that can be written out as JSON.
+
+        >>> from event import create_event_list
+        >>> from simulation import Simulation
+        >>> profiler = Profiler()
+        >>> _ = Simulation(profiler=profiler).run(
+        ...     create_event_list('events.txt'))
+        >>> report = profiler.report()
+        >>> sorted(report['events'])
+        ['Cancellation', 'DriverRequest', 'Dropoff', 'Pickup', 'RiderRequest']
+        >>> report['events']['Cancellation']['count']
+        1
+        >>> report['queue']['max_depth'], report['queue']['dropped']
+        (8, 5)
+
+        Events cancelled after a drained run has taken them from the queue
+        count as dropped too, so the count does not depend on draining.
+
+        >>> import os, tempfile
+        >>> from tracegen import City
+        >>> handle, filename = tempfile.mkstemp()
+        >>> os.close(handle)
+        >>> _ = City(drivers=50, rate=5, patience=(1, 10), seed=1).write(
+        ...     filename, 2000)
+        >>> dropped = []
+        >>> for drain in (False, True):
+        ...     profiler = Profiler()
+        ...     _ = Simulation(profiler=profiler).run(
+        ...         create_event_list(filename), drain=drain)
+        ...     dropped.append(profiler.dropped)
+        >>> os.remove(filename)
+        >>> dropped
+        [21, 21]
+        """
+        return {
+            'events': {
+                name: {'count': count,
+                       'nanoseconds': self.nanoseconds[name],
+                       'mean_nanoseconds': self.nanoseconds[name] / count}
+                for name, count in sorted(self.counts.items())},
+            'queue': {'max_depth': max(self._depths, default=0),
+                      'dropped': self.dropped,
+                      'depth': [[time, depth] for time, depth
+                                in zip(self._times, self._depths)]},
+            'dispatcher': {'lookups': self.lookups,
+                           'nanoseconds': self.lookup_nanoseconds},
+            'monitor': {'notifications': self.notifications,
+                        'nanoseconds': self.notify_nanoseconds}}
+
+
+class TimedDispatcher:
+    """A dispatcher that records the time taken by another dispatcher in a
+    Profiler.
+
+    Everything except the lookups is passed straight through to the other
+    dispatcher.
+    """
+
+    # === Private Attributes ===
+    _dispatcher: Dispatcher
+    #     The dispatcher being timed.
+    _profiler: Profiler
+    #     The profiler to record the time in.
+
+    def __init__(self, dispatcher: Dispatcher, profiler: Profiler) -> None:
+        """Initialize a TimedDispatcher for <dispatcher>.
+
+        """
+        self._dispatcher = dispatcher
+        self._profiler = profiler
+
+    def __getattr__(self, name: str) -> Any:
+        """Return the attribute <name> of the timed dispatcher.
+
+        """
+        return getattr(self._dispatcher, name)
+
+    def request_driver(self, rider: Rider) -> Optional[Driver]:
+        """Return a driver for the rider, as the timed dispatcher does.
+
+        """
+        start = perf_counter_ns()
+        driver = self._dispatcher.request_driver(rider)
+        self._profiler.lookup_nanoseconds += perf_counter_ns() - start
+        self._profiler.lookups += 1
+        return driver
+
+    def request_rider(self, driver: Driver) -> Optional[Rider]:
+        """Return a rider for the driver, as the timed dispatcher does.
+
+        """
+        start = perf_counter_ns()
+        rider = self._dispatcher.request_rider(driver)
+        self._profiler.lookup_nanoseconds += perf_counter_ns() - start
+        self._profiler.lookups += 1
+        return rider
+
+    def assign_batch(self) -> List[Any]:
+        """Return the matches made by the timed dispatcher.
+
+        """
+        start = perf_counter_ns()
+        pairs = self._dispatcher.assign_batch()
+        self._profiler.lookup_nanoseconds += perf_counter_ns() - start
+        self._profiler.lookups += 1
+        return pairs
+
+
+class TimedMonitor:
+    """A monitor that records the time taken by another monitor in a
+    Profiler.
+
+    Everything except notify is passed straight through to the other
+    monitor.
+    """
+
+    # === Private Attributes ===
+    _monitor: Monitor
+    #     The monitor being timed.
+    _profiler: Profiler
+    #     The profiler to record the time in.
+
+    def __init__(self, monitor: Monitor, profiler: Profiler) -> None:
+        """Initialize a TimedMonitor for <monitor>.
+
+        """
+        self._monitor = monitor
+        self._profiler = profiler
+
+    def __getattr__(self, name: str) -> Any:
+        """Return the attribute <name> of the timed monitor.
+
+        """
+        return getattr(self._monitor, name)
+
+    def notify(self, timestamp: int, category: str, description: str,
+               identifier: str, location: Location) -> None:
+        """Notify the timed monitor of the activity.
+
+        """
+        start = perf_counter_ns()
+        self._monitor.notify(timestamp, category, description, identifier,
+                             location)
+        self._profiler.notify_nanoseconds += perf_counter_ns() - start
+        self._profiler.notifications += 1
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={'extra-imports': ['array', 'time', 'typing', 'dispatcher',
+                                  'driver', 'location', 'monitor', 'rider']})
@@ -8,6 +8,7 @@ CANCELLED: A constant used for the cancelled rider status.
 SATISFIED: A constant used for the satisfied rider status
 """
 
+from typing import Any, Optional
 from location import Location
 
 WAITING = "waiting"
@@ -27,12 +28,18 @@ class Rider:
         destination: Where the rider wants to go
         status: if the rider is waiting to
                 be picked up, cancelled, or satisfied
+        cancellation: The event for when the rider runs out of patience,
+                      or None if there is no such event pending
     """
     id: str
     patience: int
     origin: Location
     destination: Location
     status: str
+    cancellation: Optional[Any]
+
+    __slots__ = ('id', 'patience', 'origin', 'destination', 'status',
+                 'cancellation')
 
     def __init__(self, identifier: str, patience: int, origin: Location,
                  destination: Location) -> None:
@@ -44,6 +51,7 @@ class Rider:
         self.origin = origin
         self.destination = destination
         self.status = WAITING
+        self.cancellation = None
 
     def __str__(self) -> str:
         """Return a string representation.
@@ -54,4 +62,4 @@ class Rider:
 
 if __name__ == '__main__':
     import python_ta
-    python_ta.check_all(config={'extra-imports': ['location']})
+    python_ta.check_all(config={'extra-imports': ['typing', 'location']})
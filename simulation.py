@@ -1,10 +1,18 @@
 """Starting point for simulation"""
 
-from typing import List, Dict
-from container import PriorityQueue
+import os
+import pickle
+import tempfile
+from heapq import merge
+from itertools import chain, islice
+from operator import attrgetter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, \
+    Union
+from container import CalendarQueue, PriorityQueue
 from dispatcher import Dispatcher
-from event import Event, create_event_list
+from event import Event, Pickup, create_event_list
 from monitor import Monitor
+from profiler import Profiler, TimedDispatcher, TimedMonitor
 
 
 class Simulation:
@@ -13,65 +21,430 @@ class Simulation:
     This is the class that is responsible for setting up and running a
     simulation.
 
-    The API is given to you: your main task is to implement the run
-    method below according to its docstring.
-
-    Of course, you may add whatever private attributes and methods you want.
-    But because you should not change the interface, you may not add any public
-    attributes or methods.
+    run does a whole simulation and returns its statistics. A simulation
+    can also be advanced a step at a time with advance and finished later
+    with run, and a run that saved checkpoints can be picked up again with
+    resume. The monitor, dispatcher, event queue and profiler to use are
+    chosen when the simulation is created.
 
     This is the entry point into your program, and in particular is used for
-    auto-testing purposes. This makes it ESSENTIAL that you do not change the
-    interface in any way!
+    auto-testing purposes. Simulation() and run(initial_events) must keep
+    working exactly as they always have; every parameter added since has a
+    default that leaves them unchanged.
+
+    === Attributes ===
+    now: The time the simulation has been advanced to. Every event before
+        it has been done, and no initial event may be earlier than it.
     """
+    now: int
 
     # === Private Attributes ===
-    _events: PriorityQueue
+    _events: Union[PriorityQueue, CalendarQueue]
     #     A sequence of events arranged in priority determined by the event
     #     sorting order.
     _dispatcher: Dispatcher
     #     The dispatcher associated with the simulation.
     _monitor: Monitor
     #     The monitor associated with the simulation.
+    _profiler: Optional[Profiler]
+    #     The profiler that records where the time in each run goes, or None
+    #     if runs are not profiled.
+    _dropped: int
+    #     The number of events dropped from the event queue that have been
+    #     added to the profiler.
+    _pending: List[Event]
+    #     The initial events left in the stream of a run that was stopped,
+    #     in timestamp order.
 
-    def __init__(self) -> None:
+    def __init__(self, monitor: Optional[Monitor] = None,
+                 dispatcher: Optional[Dispatcher] = None,
+                 scheduler: str = 'heap',
+                 profiler: Optional[Profiler] = None) -> None:
         """Initialize a Simulation.
 
+        monitor: The monitor to record activities with. By default this is
+            a new Monitor that keeps every activity.
+        dispatcher: The dispatcher to serve requests with. By default this
+            is a new Dispatcher that serves each request as it comes in. A
+            batched dispatcher is asked to match riders and drivers after
+            all the events at each timestamp have been done.
+        scheduler: The event queue to use. 'heap' is a PriorityQueue, and
+            'calendar' is a CalendarQueue, which is faster when most events
+            are scheduled a short time ahead.
+        profiler: The profiler to record where the time in each run goes
+            in, or None to not profile runs. Its report is separate from
+            the one returned by run.
         """
-        self._events = PriorityQueue()
-        self._dispatcher = Dispatcher()
-        self._monitor = Monitor()
+        if scheduler == 'heap':
+            self._events = PriorityQueue(key=attrgetter('timestamp'),
+                                         dead=attrgetter('cancelled'))
+        elif scheduler == 'calendar':
+            self._events = CalendarQueue(key=attrgetter('timestamp'),
+                                         dead=attrgetter('cancelled'))
+        else:
+            raise ValueError("Unknown scheduler: {}".format(scheduler))
+        if dispatcher is None:
+            dispatcher = Dispatcher()
+        self._dispatcher = dispatcher
+        if monitor is None:
+            monitor = Monitor()
+        self._monitor = monitor
+        self._profiler = profiler
+        self._dropped = 0
+        self._pending = []
+        self.now = 0
 
-    def run(self, initial_events: List[Event]) -> Dict[str, float]:
+    def run(self, initial_events: Iterable[Event], drain: bool = True,
+            checkpoint: Optional[str] = None,
+            interval: int = 1000) -> Dict[str, float]:
         """Run the simulation on the list of events in <initial_events>.
 
         Return a dictionary containing statistics of the simulation,
         according to the specifications in the assignment handout.
 
-        initial_events: An initial list of events.
+        initial_events: An initial list of events. If this is not a list, it
+            is read lazily as a stream of events, and must be ordered by
+            timestamp (e.g. the events from event.iter_events).
+        drain: whether to take all the events with the same timestamp from
+            the event queue at once, and add the events they return in bulk.
+            The events are done in the same order either way.
+        checkpoint: The name of a file to save the state of the simulation
+            to, so that the run can be resumed if it is interrupted, or None
+            to not save it. This needs drain.
+        interval: The simulated time between saves of the state.
+
+        >>> from event import create_event_list
+        >>> each = Simulation().run(create_event_list('events.txt'),
+        ...                         drain=False)
+        >>> drained = Simulation().run(create_event_list('events.txt'))
+        >>> repr(drained) == repr(each)
+        True
+
+        The same holds for a busier city, with either event queue and with
+        batched dispatch:
+
+        >>> import os, tempfile
+        >>> from tracegen import City
+        >>> handle, filename = tempfile.mkstemp()
+        >>> os.close(handle)
+        >>> _ = City(rate=3).write(filename, 1000)
+        >>> for scheduler in ('heap', 'calendar'):
+        ...     for batched in (False, True):
+        ...         reports = [
+        ...             repr(Simulation(Monitor(), Dispatcher(batched=batched),
+        ...                             scheduler).run(
+        ...                 create_event_list(filename), drain=drain))
+        ...             for drain in (False, True)]
+        ...         print(scheduler, batched, reports[0] == reports[1])
+        heap False True
+        heap True True
+        calendar False True
+        calendar True True
+        >>> os.remove(filename)
+        """
+        if checkpoint is not None and not drain:
+            raise ValueError("Checkpoints are only saved when draining")
+        stream, consumed = self._start(initial_events)
+        self._continue(stream, drain, consumed, checkpoint, interval)
+        return self._monitor.report()
+
+    def advance(self, initial_events: Iterable[Event], until: int) -> None:
+        """Do the events in <initial_events> and the event queue with
+        timestamps before <until>, and stop.
+
+        Later calls to advance or run carry on from there, so a simulation
+        can be advanced to a point and then copied to try out different
+        futures. The rest of a stream of initial events is read into memory
+        when the simulation stops.
+
+        >>> from event import create_event_list
+        >>> simulation = Simulation()
+        >>> simulation.advance(create_event_list('events.txt'), 10)
+        >>> simulation.now
+        10
+        >>> simulation.advance(create_event_list('events.txt'), 20)
+        Traceback (most recent call last):
+        ...
+        ValueError: Initial events must not be earlier than 10
+        >>> later = simulation.run([])
+        >>> later == Simulation().run(create_event_list('events.txt'))
+        True
+
+        Events added tick by tick are done just as in a single run.
+
+        >>> import os, tempfile
+        >>> from tracegen import City
+        >>> handle, filename = tempfile.mkstemp()
+        >>> os.close(handle)
+        >>> _ = City(rate=2).write(filename, 500)
+        >>> whole = Simulation().run(create_event_list(filename))
+        >>> events = create_event_list(filename)
+        >>> os.remove(filename)
+        >>> simulation = Simulation()
+        >>> for until in range(1, events[-1].timestamp + 2):
+        ...     simulation.advance([event for event in events
+        ...                         if event.timestamp == until - 1], until)
+        >>> simulation.run([]) == whole
+        True
+        """
+        stream, consumed = self._start(initial_events)
+        self._continue(stream, True, consumed, None, 0, until)
+        self.now = max(self.now, until)
+
+    def _start(self, initial_events: Iterable[Event]) -> Tuple[
+            Iterator[Event], int]:
+        """Add <initial_events> to the simulation, and return the stream of
+        events still to be taken and the number of initial events taken.
+
+        """
+        # Add all initial events in a list to the event queue. If events are
+        # already queued, e.g. after advance, stream the list in timestamp
+        # order instead, so that it goes before queued events with the same
+        # timestamp just as it would have in a single run.
+        consumed = 0
+        if isinstance(initial_events, list):
+            if initial_events and self.now > 0 and min(
+                    event.timestamp for event in initial_events) < self.now:
+                self._reject_early()
+            if self._events.is_empty():
+                self._events.extend(initial_events)
+                consumed = len(initial_events)
+                initial_events = []
+            else:
+                initial_events = sorted(initial_events,
+                                        key=attrgetter('timestamp'))
+        # Until there are no more events, take the next events from either
+        # the stream or the event queue and do them. Add any returned events
+        # to the event queue. A streamed event goes before queued events with
+        # the same timestamp, just as if it had been added up front. The
+        # events left in an earlier stream go first.
+        stream = iter(initial_events)
+        if self.now > 0:
+            first = next(stream, None)
+            if first is not None:
+                if first.timestamp < self.now:
+                    self._reject_early()
+                stream = chain([first], stream)
+        if self._pending:
+            stream = merge(self._pending, stream,
+                           key=attrgetter('timestamp'))
+            self._pending = []
+        return stream, consumed
+
+    def _reject_early(self) -> None:
+        """Raise a ValueError for initial events earlier than the time the
+        simulation has been advanced to.
+
+        """
+        raise ValueError("Initial events must not be earlier than {}".format(
+            self.now))
+
+    @staticmethod
+    def resume(checkpoint: str,
+               initial_events: Iterable[Event]) -> Dict[str, float]:
+        """Resume the run whose state was last saved to <checkpoint>, and
+        return the statistics it would have returned.
+
+        initial_events: The same initial events the run was started with.
+            Those the run had already taken are skipped.
+
+        >>> import os, tempfile
+        >>> from event import create_event_list
+        >>> handle, checkpoint = tempfile.mkstemp()
+        >>> os.close(handle)
+        >>> whole = Simulation().run(create_event_list('events.txt'),
+        ...                          checkpoint=checkpoint, interval=5)
+        >>> resumed = Simulation.resume(checkpoint,
+        ...                             create_event_list('events.txt'))
+        >>> os.remove(checkpoint)
+        >>> repr(resumed) == repr(whole)
+        True
         """
+        with open(checkpoint, 'rb') as file:
+            simulation, consumed, interval = pickle.load(file)
+        # Drop whatever the interrupted run wrote after the checkpoint.
+        simulation._monitor.rewind_sink()
+        stream = islice(iter(initial_events), consumed, None)
+        simulation._continue(stream, True, consumed, checkpoint, interval)
+        return simulation._monitor.report()
 
-        # Add all initial events to the event queue.
-        for event in initial_events:
-            self._events.add(event)
-        # Until there are no more events, remove an event
-        # from the event queue and do it. Add any returned
-        # events to the event queue.
-        while not self._events.is_empty():
-            new = self._events.remove()
-            future = new.do(self._dispatcher, self._monitor)
+    def _continue(self, stream: Iterator[Event], drain: bool, consumed: int,
+                  checkpoint: Optional[str], interval: int,
+                  until: Optional[int] = None) -> None:
+        """Do the events in the event queue and <stream>, up to but not
+        including those at <until>, if it is given.
+
+        consumed: The number of initial events already taken by the
+            simulation.
+        """
+        try:
+            if drain:
+                self._run_batches(stream, consumed, checkpoint, interval,
+                                  until)
+            else:
+                self._run_each(stream)
+        finally:
+            self._count_dropped()
+
+    def _count_dropped(self) -> None:
+        """Add the events dropped from the event queue since the last call to
+        the profiler.
+
+        """
+        if self._profiler is not None:
+            self._profiler.dropped += self._events.dropped - self._dropped
+        self._dropped = self._events.dropped
+
+    def _save(self, checkpoint: str, consumed: int, interval: int) -> None:
+        """Save the state of the simulation to the file <checkpoint>, after
+        <consumed> initial events have been taken.
+
+        The state is written to a temporary file that then replaces
+        <checkpoint>, so an interruption never leaves a partial state.
+
+        """
+        self._count_dropped()
+        directory = os.path.dirname(os.path.abspath(checkpoint))
+        handle, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as file:
+                pickle.dump((self, consumed, interval), file,
+                            pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, checkpoint)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    def _timed(self) -> Tuple[Dispatcher, Monitor]:
+        """Return the dispatcher and monitor for events to use: the
+        simulation's own, or stand-ins that time them if it is profiled.
+
+        """
+        if self._profiler is None:
+            return self._dispatcher, self._monitor
+        return (TimedDispatcher(self._dispatcher, self._profiler),
+                TimedMonitor(self._monitor, self._profiler))
+
+    def _run_each(self, stream: Iterator[Event]) -> None:
+        """Do the events in the event queue and <stream> one at a time.
+
+        """
+        profiler = self._profiler
+        dispatcher, monitor = self._timed()
+        upcoming = next(stream, None)
+        while upcoming is not None or not self._events.is_empty():
+            if upcoming is not None and (
+                    self._events.is_empty()
+                    or upcoming.timestamp <= self._events.peek().timestamp):
+                new = upcoming
+                upcoming = next(stream, None)
+                if upcoming is not None and upcoming < new:
+                    raise ValueError("Streamed events must be ordered by "
+                                     "timestamp")
+            else:
+                new = self._events.remove()
+            if profiler is None:
+                future = new.do(dispatcher, monitor)
+            else:
+                future = profiler.do(new, dispatcher, monitor)
             for i in future:
                 self._events.add(i)
+            if (dispatcher.batched or profiler is not None) and not (
+                    upcoming is not None
+                    and upcoming.timestamp == new.timestamp
+                    or not self._events.is_empty()
+                    and self._events.peek().timestamp == new.timestamp):
+                if dispatcher.batched:
+                    self._assign_batch(dispatcher, new.timestamp)
+                if profiler is not None:
+                    profiler.sample(new.timestamp, len(self._events))
 
-        return self._monitor.report()
+    def _run_batches(self, stream: Iterator[Event], consumed: int,
+                     checkpoint: Optional[str], interval: int,
+                     until: Optional[int] = None) -> None:
+        """Do the events in the event queue and <stream> a timestamp at a
+        time.
+
+        Events returned with the current timestamp go after every event
+        already taken for it, so they are done in the next batch. If a
+        <checkpoint> file is given, the state of the simulation is saved to
+        it between timestamps, whenever <interval> has passed since the
+        last save. If <until> is given, stop before the events at <until>
+        or later, and keep the rest of the stream.
+
+        """
+        profiler = self._profiler
+        dispatcher, monitor = self._timed()
+        next_save = None
+        upcoming = next(stream, None)
+        while upcoming is not None or not self._events.is_empty():
+            if upcoming is not None and (
+                    self._events.is_empty()
+                    or upcoming.timestamp <= self._events.peek().timestamp):
+                timestamp = upcoming.timestamp
+            else:
+                timestamp = self._events.peek().timestamp
+            if until is not None and timestamp >= until:
+                if upcoming is not None:
+                    self._pending = [upcoming]
+                    self._pending.extend(stream)
+                return
+            if checkpoint is not None:
+                if next_save is not None and timestamp >= next_save:
+                    self._save(checkpoint, consumed, interval)
+                if next_save is None or timestamp >= next_save:
+                    next_save = timestamp + interval
+            batch = []
+            while upcoming is not None and upcoming.timestamp == timestamp:
+                batch.append(upcoming)
+                upcoming = next(stream, None)
+                if upcoming is not None and upcoming < batch[-1]:
+                    raise ValueError("Streamed events must be ordered by "
+                                     "timestamp")
+            consumed += len(batch)
+            while not self._events.is_empty() and \
+                    self._events.peek().timestamp == timestamp:
+                batch.append(self._events.remove())
+            future = []
+            if profiler is None:
+                for new in batch:
+                    if not new.cancelled:
+                        future.extend(new.do(dispatcher, monitor))
+            else:
+                for new in batch:
+                    if new.cancelled:
+                        # Cancelled after it was taken, so the queue never
+                        # dropped it.
+                        profiler.dropped += 1
+                    else:
+                        future.extend(profiler.do(new, dispatcher, monitor))
+            self._events.extend(future)
+            if dispatcher.batched and (
+                    self._events.is_empty()
+                    or self._events.peek().timestamp != timestamp):
+                self._assign_batch(dispatcher, timestamp)
+            if profiler is not None:
+                profiler.sample(timestamp, len(self._events))
+
+    def _assign_batch(self, dispatcher: Dispatcher, timestamp: int) -> None:
+        """Start the drives for the riders and drivers matched by
+        <dispatcher> at <timestamp>, and add their pickups to the event
+        queue.
+
+        """
+        for rider, driver in dispatcher.assign_batch():
+            travel_time = driver.start_drive(rider.origin)
+            self._events.add(Pickup(timestamp + travel_time, rider, driver))
 
 
 if __name__ == "__main__":
     import python_ta
     python_ta.check_all(
         config={
-            'extra-imports': ['typing', 'container', 'dispatcher', 'event',
-                              'monitor']})
+            'extra-imports': ['os', 'pickle', 'tempfile', 'heapq',
+                              'itertools',
+                              'operator', 'typing', 'container',
+                              'dispatcher', 'event', 'monitor', 'profiler']})
 
     events = create_event_list("events.txt")
     sim = Simulation()
@@ -0,0 +1,136 @@
+"""Streaming summaries of the values seen in a simulation"""
+
+from __future__ import annotations
+from math import ceil
+from typing import Dict, List
+
+
+class Histogram:
+    """A histogram of non-negative integers, with buckets whose width grows
+    with the size of the values they hold.
+
+    Values below 2 ** (precision + 1) each have their own bucket and are
+    kept exactly. Larger values share buckets of width 2 ** e, so a
+    quantile is never more than a fraction 2 ** -precision below the true
+    value. Only the non-empty buckets are stored, and there are at most
+    2 ** precision of them for each power of two, so memory is bounded no
+    matter how many values are added.
+    """
+
+    # === Private Attributes ===
+    _precision: int
+    #     The number of bits of each value kept exactly.
+    _counts: Dict[int, int]
+    #     The number of values in each bucket, by the bucket's lowest value.
+    _total: int
+    #     The number of values in this histogram.
+
+    def __init__(self, precision: int = 7) -> None:
+        """Initialize an empty Histogram.
+
+        """
+        self._precision = precision
+        self._counts = {}
+        self._total = 0
+
+    def __len__(self) -> int:
+        """Return the number of values added to this histogram.
+
+        """
+        return self._total
+
+    def add(self, value: int) -> None:
+        """Add <value> to this histogram.
+
+        Precondition: value >= 0
+        """
+        shift = value.bit_length() - self._precision - 1
+        if shift > 0:
+            value = value >> shift << shift
+        self._counts[value] = self._counts.get(value, 0) + 1
+        self._total += 1
+
+    def merge(self, other: Histogram) -> None:
+        """Add all the values in <other> to this histogram.
+
+        Precondition: other has the same precision as this histogram.
+        """
+        for value, count in other._counts.items():
+            self._counts[value] = self._counts.get(value, 0) + count
+        self._total += other._total
+
+    def copy(self) -> Histogram:
+        """Return a copy of this histogram.
+
+        """
+        histogram = Histogram(self._precision)
+        histogram.merge(self)
+        return histogram
+
+    def subtract(self, other: Histogram) -> None:
+        """Remove all the values in <other> from this histogram.
+
+        Precondition: every value in <other> is in this histogram, e.g.
+        <other> is an earlier copy of it.
+
+        >>> histogram = Histogram(precision=3)
+        >>> for value in (1, 2, 3):
+        ...     histogram.add(value)
+        >>> earlier = histogram.copy()
+        >>> for value in (10, 12):
+        ...     histogram.add(value)
+        >>> histogram.subtract(earlier)
+        >>> len(histogram), histogram.quantile(0.0), histogram.quantile(1.0)
+        (2, 10, 12)
+        """
+        for value, count in other._counts.items():
+            remaining = self._counts[value] - count
+            if remaining:
+                self._counts[value] = remaining
+            else:
+                del self._counts[value]
+        self._total -= other._total
+
+    def quantile(self, q: float) -> float:
+        """Return the smallest value that at least a fraction <q> of the
+        values in this histogram are less than or equal to, or nan if the
+        histogram is empty.
+
+        >>> values = [3, 1, 4, 1, 5, 9, 2, 6, 5, 3, 5, 1000]
+        >>> histogram = Histogram(precision=3)
+        >>> for value in values:
+        ...     histogram.add(value)
+        >>> [histogram.quantile(q) for q in (0.5, 0.9, 1.0)]
+        [4, 9, 960]
+        >>> [exact_quantile(values, q) for q in (0.5, 0.9, 1.0)]
+        [4, 9, 1000]
+        """
+        if not self._total:
+            return float('nan')
+        rank = max(ceil(q * self._total), 1)
+        seen = 0
+        for value in sorted(self._counts):
+            seen += self._counts[value]
+            if seen >= rank:
+                return value
+        return max(self._counts)
+
+
+def exact_quantile(values: List[int], q: float) -> float:
+    """Return the smallest value in <values> that at least a fraction <q> of
+    them are less than or equal to, or nan if there are no values.
+
+    This sorts a copy of <values>, and gives the result a Histogram
+    approximates.
+
+    >>> exact_quantile([5, 1, 3], 0.5)
+    3
+    """
+    if not values:
+        return float('nan')
+    return sorted(values)[max(ceil(q * len(values)), 1) - 1]
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={'extra-imports': ['math', 'typing']})
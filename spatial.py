@@ -0,0 +1,289 @@
+"""Spatial indexes over the drivers in the simulation"""
+
+from typing import Dict, List, Optional, Tuple
+from driver import Driver
+from location import Location
+try:
+    import numpy
+except ImportError:  # NumPy is optional; only FleetArray needs it.
+    numpy = None
+
+
+class GridIndex:
+    """An index of drivers by location, used to find the driver that can get
+    to a location the fastest.
+
+    The map is divided into square cells of <cell_size> by <cell_size>
+    locations, and each driver is kept in the cell that contains their
+    location. A nearest driver search visits rings of cells around the
+    target, expanding outwards until no driver in an unvisited ring could
+    possibly arrive sooner than the best driver found so far.
+
+    Every driver in the index has a rank. When several drivers have the same
+    travel time, the driver with the lowest rank is chosen.
+    """
+
+    # === Private Attributes ===
+    _cell_size: int
+    #     The width and height of a cell.
+    _cells: Dict[Tuple[int, int], Dict[str, Tuple[int, Driver]]]
+    #     A dictionary whose key is a cell, and value is another dictionary.
+    #     The key of the second dictionary is a driver identifier and its
+    #     value is the rank of that driver and the driver.
+    _where: Dict[str, Tuple[int, int]]
+    #     The cell of each driver in the index, by driver identifier.
+    _max_speed: int
+    #     The highest speed of any driver ever added to the index.
+    _bounds: Optional[Tuple[int, int, int, int]]
+    #     The lowest row, highest row, lowest column and highest column of
+    #     any cell that has ever held a driver, or None if no driver has been
+    #     added.
+
+    def __init__(self, cell_size: int = 8) -> None:
+        """Initialize an empty GridIndex.
+
+        """
+        self._cell_size = cell_size
+        self._cells = {}
+        self._where = {}
+        self._max_speed = 0
+        self._bounds = None
+
+    def __len__(self) -> int:
+        """Return the number of drivers in this index.
+
+        """
+        return len(self._where)
+
+    def _cell(self, location: Location) -> Tuple[int, int]:
+        """Return the cell that contains <location>.
+
+        """
+        return (location.row // self._cell_size,
+                location.col // self._cell_size)
+
+    def add(self, driver: Driver, rank: int) -> None:
+        """Add <driver> to this index at their current location with the given
+        <rank>, replacing any earlier entry for the driver.
+
+        """
+        self.remove(driver)
+        cell = self._cell(driver.location)
+        self._cells.setdefault(cell, {})[driver.id] = (rank, driver)
+        self._where[driver.id] = cell
+        self._max_speed = max(self._max_speed, driver.speed)
+        if self._bounds is None:
+            self._bounds = (cell[0], cell[0], cell[1], cell[1])
+        else:
+            low_row, high_row, low_col, high_col = self._bounds
+            self._bounds = (min(low_row, cell[0]), max(high_row, cell[0]),
+                            min(low_col, cell[1]), max(high_col, cell[1]))
+
+    def remove(self, driver: Driver) -> None:
+        """Remove <driver> from this index, if they are in it.
+
+        """
+        cell = self._where.pop(driver.id, None)
+        if cell is not None:
+            drivers = self._cells[cell]
+            del drivers[driver.id]
+            if not drivers:
+                del self._cells[cell]
+
+    def nearest(self, location: Location) -> Optional[Driver]:
+        """Return the driver with the shortest travel time to <location>, or
+        None if this index is empty.
+
+        Ties are broken in favour of the driver with the lowest rank.
+
+        >>> index = GridIndex(cell_size=2)
+        >>> index.add(Driver('far', Location(9, 9), 1), 0)
+        >>> index.add(Driver('slow', Location(1, 3), 1), 1)
+        >>> index.add(Driver('fast', Location(3, 3), 4), 2)
+        >>> index.nearest(Location(1, 1)).id
+        'fast'
+        >>> index.add(Driver('tied', Location(0, 1), 1), 3)
+        >>> index.add(Driver('first', Location(1, 0), 1), -1)
+        >>> index.nearest(Location(1, 1)).id
+        'first'
+        """
+        if not self._where:
+            return None
+        row, col = self._cell(location)
+        low_row, high_row, low_col, high_col = self._bounds
+        last_ring = max(row - low_row, high_row - row,
+                        col - low_col, high_col - col)
+        best = None
+        best_key = None
+        ring = 0
+        while ring <= last_ring:
+            if 8 * ring > len(self._where):
+                # The remaining rings have more cells than there are
+                # drivers, so it is cheaper to look at every driver.
+                return self._scan(location)
+            if best_key is not None and ring > 0:
+                # Every location in this ring is at least this far away.
+                distance = (ring - 1) * self._cell_size + 1
+                if round(distance / self._max_speed) > best_key[0]:
+                    break
+            for cell in _ring(row, col, ring):
+                for rank, driver in self._cells.get(cell, {}).values():
+                    key = (driver.get_travel_time(location), rank)
+                    if best_key is None or key < best_key:
+                        best, best_key = driver, key
+            ring += 1
+        return best
+
+    def _scan(self, location: Location) -> Optional[Driver]:
+        """Return the driver with the shortest travel time to <location>,
+        looking at every driver in this index.
+
+        """
+        best = None
+        best_key = None
+        for drivers in self._cells.values():
+            for rank, driver in drivers.values():
+                key = (driver.get_travel_time(location), rank)
+                if best_key is None or key < best_key:
+                    best, best_key = driver, key
+        return best
+
+
+class FleetArray:
+    """An index of drivers kept in NumPy arrays, used to find the driver that
+    can get to a location the fastest by computing the travel time of every
+    driver at once.
+
+    This has the same interface as GridIndex. The arrays are packed: the
+    drivers in the index are in the first len(self) positions, in no
+    particular order.
+    """
+
+    # === Private Attributes ===
+    _slots: Dict[str, int]
+    #     The position of each driver in the arrays, by driver identifier.
+    _drivers: List[Driver]
+    #     The drivers in the index, by position.
+    _rows: numpy.ndarray
+    #     The row of the location of each driver, by position.
+    _cols: numpy.ndarray
+    #     The column of the location of each driver, by position.
+    _speeds: numpy.ndarray
+    #     The speed of each driver, by position.
+    _ranks: numpy.ndarray
+    #     The rank of each driver, by position.
+
+    def __init__(self, capacity: int = 64) -> None:
+        """Initialize an empty FleetArray with room for <capacity> drivers
+        before the arrays have to grow.
+
+        """
+        self._slots = {}
+        self._drivers = []
+        self._rows = numpy.zeros(capacity, dtype=numpy.int64)
+        self._cols = numpy.zeros(capacity, dtype=numpy.int64)
+        self._speeds = numpy.ones(capacity, dtype=numpy.int64)
+        self._ranks = numpy.zeros(capacity, dtype=numpy.int64)
+
+    def __len__(self) -> int:
+        """Return the number of drivers in this index.
+
+        """
+        return len(self._drivers)
+
+    def add(self, driver: Driver, rank: int) -> None:
+        """Add <driver> to this index at their current location with the given
+        <rank>, replacing any earlier entry for the driver.
+
+        """
+        slot = self._slots.get(driver.id)
+        if slot is None:
+            slot = len(self._drivers)
+            if slot == len(self._rows):
+                self._rows, self._cols, self._speeds, self._ranks = [
+                    numpy.concatenate((array, array))
+                    for array in (self._rows, self._cols, self._speeds,
+                                  self._ranks)]
+            self._slots[driver.id] = slot
+            self._drivers.append(driver)
+        else:
+            self._drivers[slot] = driver
+        self._rows[slot] = driver.location.row
+        self._cols[slot] = driver.location.col
+        self._speeds[slot] = driver.speed
+        self._ranks[slot] = rank
+
+    def remove(self, driver: Driver) -> None:
+        """Remove <driver> from this index, if they are in it.
+
+        The last driver in the arrays is moved into the freed position.
+
+        """
+        slot = self._slots.pop(driver.id, None)
+        if slot is None:
+            return
+        last = len(self._drivers) - 1
+        moved = self._drivers.pop()
+        if slot != last:
+            self._drivers[slot] = moved
+            self._slots[moved.id] = slot
+            for array in (self._rows, self._cols, self._speeds, self._ranks):
+                array[slot] = array[last]
+
+    def nearest(self, location: Location) -> Optional[Driver]:
+        """Return the driver with the shortest travel time to <location>, or
+        None if this index is empty.
+
+        Ties are broken in favour of the driver with the lowest rank.
+
+        >>> index = FleetArray(capacity=1)
+        >>> index.add(Driver('far', Location(9, 9), 1), 0)
+        >>> index.add(Driver('slow', Location(1, 3), 1), 1)
+        >>> index.add(Driver('fast', Location(3, 3), 4), 2)
+        >>> index.nearest(Location(1, 1)).id
+        'fast'
+        >>> index.add(Driver('tied', Location(0, 1), 1), 3)
+        >>> index.add(Driver('first', Location(1, 0), 1), -1)
+        >>> index.nearest(Location(1, 1)).id
+        'first'
+        >>> index.remove(Driver('first', Location(1, 0), 1))
+        >>> index.nearest(Location(1, 1)).id
+        'fast'
+        """
+        count = len(self._drivers)
+        if count == 0:
+            return None
+        distances = (numpy.abs(self._rows[:count] - location.row)
+                     + numpy.abs(self._cols[:count] - location.col))
+        # NumPy rounds halves to even, just like Driver.get_travel_time.
+        times = numpy.round(distances / self._speeds[:count])
+        ties = numpy.flatnonzero(times == times.min())
+        return self._drivers[ties[numpy.argmin(self._ranks[ties])]]
+
+
+def _ring(row: int, col: int, radius: int) -> list:
+    """Return the cells whose Chebyshev distance from the cell (row, col) is
+    exactly <radius>.
+
+    >>> _ring(0, 0, 0)
+    [(0, 0)]
+    >>> len(_ring(0, 0, 2))
+    16
+    """
+    if radius == 0:
+        return [(row, col)]
+    cells = []
+    for c in range(col - radius, col + radius + 1):
+        cells.append((row - radius, c))
+        cells.append((row + radius, c))
+    for r in range(row - radius + 1, row + radius):
+        cells.append((r, col - radius))
+        cells.append((r, col + radius))
+    return cells
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={'extra-imports': ['typing', 'driver', 'location',
+                                  'numpy']})
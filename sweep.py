@@ -0,0 +1,173 @@
+"""Parameter sweeps over an event trace
+
+A sweep runs the same trace many times with different fleet sizes, rider
+patience and driver speeds, spread over a pool of worker processes. The
+trace is converted to a binary trace file once, and every worker reads it
+through a memory mapping, so the operating system shares one copy of it
+between all the workers.
+
+Run a sweep from the command line with, e.g.
+
+    python sweep.py events.txt --fleet 2 4 6 --patience 1 1.5 --speed 1 2
+
+which prints one CSV row per variant.
+"""
+
+from __future__ import annotations
+import argparse
+import csv
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from typing import Dict, Iterator, List, Optional
+from driver import Driver
+from event import Event, DriverRequest, RiderRequest
+from monitor import Monitor
+from rider import Rider
+from simulation import Simulation
+import tracefile
+
+
+class Variant:
+    """A variant of a trace to simulate.
+
+    === Attributes ===
+    fleet: The number of drivers to keep, in the order they first appear in
+        the trace, or None to keep them all.
+    patience: The factor the patience of every rider is scaled by.
+    speed: The factor the speed of every driver is scaled by.
+    """
+
+    fleet: Optional[int]
+    patience: float
+    speed: float
+
+    def __init__(self, fleet: Optional[int] = None, patience: float = 1,
+                 speed: float = 1) -> None:
+        """Initialize a Variant.
+
+        """
+        self.fleet = fleet
+        self.patience = patience
+        self.speed = speed
+
+    def __str__(self) -> str:
+        """Return a string representation.
+
+        """
+        return "fleet={} patience={} speed={}".format(
+            self.fleet, self.patience, self.speed)
+
+    def apply(self, events: Iterator[Event]) -> Iterator[Event]:
+        """Yield the events of this variant of <events>.
+
+        >>> from event import create_event_list
+        >>> events = create_event_list('events_small.txt')
+        >>> [(event.timestamp, event.rider.patience)
+        ...  for event in Variant(fleet=0, patience=2).apply(events)]
+        [(1, 30)]
+        """
+        drivers = 0
+        for event in events:
+            if isinstance(event, DriverRequest):
+                if self.fleet is not None and drivers >= self.fleet:
+                    continue
+                drivers += 1
+                driver = event.driver
+                if self.speed != 1:
+                    driver = Driver(driver.id, driver.location,
+                                    max(round(driver.speed * self.speed), 1))
+                yield DriverRequest(event.timestamp, driver)
+            elif isinstance(event, RiderRequest) and self.patience != 1:
+                rider = event.rider
+                yield RiderRequest(
+                    event.timestamp,
+                    Rider(rider.id, round(rider.patience * self.patience),
+                          rider.origin, rider.destination))
+            else:
+                yield event
+
+
+def grid(fleets: List[Optional[int]], patiences: List[float],
+         speeds: List[float]) -> List[Variant]:
+    """Return a Variant for every combination of the given fleet sizes,
+    patience factors and speed factors.
+
+    >>> [str(variant) for variant in grid([1, 2], [1], [1, 2])]
+    ['fleet=1 patience=1 speed=1', 'fleet=1 patience=1 speed=2', \
+'fleet=2 patience=1 speed=1', 'fleet=2 patience=1 speed=2']
+    """
+    return [Variant(fleet, patience, speed)
+            for fleet, patience, speed in product(fleets, patiences, speeds)]
+
+
+def run_variant(trace: str, variant: Variant) -> Dict[str, float]:
+    """Return the report of a simulation of <variant> of the binary trace
+    <trace>.
+
+    """
+    events = list(variant.apply(tracefile.read_events(trace)))
+    return Simulation(Monitor(history=False)).run(events)
+
+
+def sweep(filename: str, variants: List[Variant],
+          workers: Optional[int] = None) -> List[Dict[str, object]]:
+    """Simulate every variant of the event file <filename> in <variants>,
+    using up to <workers> processes (by default, one per CPU).
+
+    Return a table with one row per variant, in the same order, holding the
+    variant's parameters and its report.
+
+    <filename> may be a text event file or a binary trace.
+
+    >>> rows = sweep('events.txt', grid([3, 6], [1], [1]), workers=2)
+    >>> [(row['fleet'], row['rider_wait_time']) for row in rows]
+    [(3, 2.1666666666666665), (6, 0.5)]
+    """
+    with open(filename, 'rb') as file:
+        binary = file.read(len(tracefile.MAGIC)) == tracefile.MAGIC
+    if binary:
+        trace = filename
+    else:
+        handle, trace = tempfile.mkstemp(suffix='.bin')
+        os.close(handle)
+        tracefile.convert(filename, trace)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            reports = list(executor.map(run_variant, [trace] * len(variants),
+                                        variants))
+    finally:
+        if not binary:
+            os.remove(trace)
+    table = []
+    for variant, report in zip(variants, reports):
+        row = {'fleet': variant.fleet, 'patience': variant.patience,
+               'speed': variant.speed}
+        row.update(report)
+        table.append(row)
+    return table
+
+
+def main() -> None:
+    """Parse the command line, run the sweep and print its table as CSV.
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('trace', help='a text event file or binary trace')
+    parser.add_argument('--fleet', type=int, nargs='+', default=[None])
+    parser.add_argument('--patience', type=float, nargs='+', default=[1])
+    parser.add_argument('--speed', type=float, nargs='+', default=[1])
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    table = sweep(args.trace, grid(args.fleet, args.patience, args.speed),
+                  args.workers)
+    writer = csv.DictWriter(sys.stdout, fieldnames=list(table[0]))
+    writer.writeheader()
+    writer.writerows(table)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,330 @@
+"""Binary event trace files
+
+A binary trace holds the same DriverRequest and RiderRequest events as a text
+event file, as fixed-width records that can be read back without any string
+parsing. The layout is:
+
+    header:  magic b'UBTR', format version, record count and the offset of
+             the name table, as HEADER
+    records: one RECORD per event, in the order of the text file
+    names:   the driver and rider identifiers, separated by newlines
+
+Each record holds the timestamp, the event type, the index of the actor's
+identifier in the name table, two row,col pairs (the driver's location and
+an unused pair, or the rider's origin and destination), the driver's speed
+and the rider's patience.
+
+Convert a text trace with
+
+    python tracefile.py events.txt events.bin
+"""
+
+import mmap
+import re
+import struct
+import sys
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+from driver import Driver
+from event import (Event, DriverRequest, RiderRequest, iter_events,
+                   parse_line)
+from location import intern_location
+from rider import Rider
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = b'UBTR'
+VERSION = 1
+HEADER = struct.Struct('<4sIQQ')
+RECORD = struct.Struct('<qB3xIiiiiii')
+
+DRIVER_REQUEST = 0
+RIDER_REQUEST = 1
+
+# The number of characters of a text event file tokenized at a time.
+CHUNK_SIZE = 1 << 20
+
+# A chunk of lines in the usual layout of an event file, as written by
+# tracegen, with no blank lines, comments or extra whitespace.
+_NUMBER = r'-?[0-9]{1,10}'
+_CANONICAL = re.compile(
+    r'(?:-?[0-9]{{1,18}} (?:DriverRequest [!-~]+ {0},{0} {0}'
+    r'|RiderRequest [!-~]+ {0},{0} {0},{0} {0})\n)*'.format(_NUMBER))
+_ACTOR = re.compile(r'^[^ ]+ [^ ]+ ([^ ]+)', re.MULTILINE)
+_DRIVER = re.compile(r'DriverRequest [^ ]+')
+_DRIVER_NUMBERS = '{} 0 0'.format(DRIVER_REQUEST)
+_RIDER = re.compile(r'RiderRequest [^ ]+')
+_RIDER_NUMBERS = str(RIDER_REQUEST)
+
+if numpy is not None:
+    _RECORD_DTYPE = numpy.dtype({
+        'names': ['timestamp', 'kind', 'name', 'row', 'col', 'other_row',
+                  'other_col', 'speed', 'patience'],
+        'formats': ['<i8', 'u1', '<u4', '<i4', '<i4', '<i4', '<i4', '<i4',
+                    '<i4'],
+        'offsets': [0, 8, 12, 16, 20, 24, 28, 32, 36],
+        'itemsize': RECORD.size})
+
+
+def convert(source: str, destination: str) -> int:
+    """Convert the text event file <source> to a binary trace written to
+    <destination>, and return the number of events converted.
+
+    """
+    names = {}
+    with open(destination, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+        for records in pack_text(source, names):
+            file.write(records)
+        names_offset = file.tell()
+        count = (names_offset - HEADER.size) // RECORD.size
+        file.write('\n'.join(names).encode())
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, VERSION, count, names_offset))
+    return count
+
+
+def pack_text(source: str, names: Dict[str, int],
+              chunk_size: int = CHUNK_SIZE,
+              vectorized: bool = True) -> Iterator[bytes]:
+    """Yield the records of the events in the text event file <source>, as
+    the records of about <chunk_size> characters of lines at a time, adding
+    the identifier of each actor to <names> if it is not there already.
+
+    The text goes straight to records, without creating any events. If
+    <vectorized> and NumPy is installed, the numbers in a chunk written in
+    the usual layout, with single spaces and no comments, are all parsed at
+    once. Other chunks are split line by line, and any line not in the usual
+    layout is left to event.parse_line, so the records and any ValueError
+    are the same as for the events of event.iter_events.
+
+    >>> import os, tempfile
+    >>> handle, filename = tempfile.mkstemp()
+    >>> os.close(handle)
+    >>> with open(filename, 'w') as file:
+    ...     _ = file.write('0 DriverRequest Amaranth 1,1 1\\n'
+    ...                    '# a comment\\n'
+    ...                    '\\n'
+    ...                    '  1\\tRiderRequest  Bergamot 1,2 -5,3 10 extra\\n'
+    ...                    '2 RiderRequest Amaranth 0,0 9,9 3\\r\\n'
+    ...                    '3 DriverRequest Cerise 4,2 2')
+    >>> names = {}
+    >>> expected = [_pack(event, names) for event in iter_events(filename)]
+    >>> for chunk_size in (1, 40, CHUNK_SIZE):
+    ...     for vectorized in (True, False):
+    ...         found = {}
+    ...         records = b''.join(pack_text(filename, found, chunk_size,
+    ...                                      vectorized))
+    ...         print(records == b''.join(expected), list(found))
+    True ['Amaranth', 'Bergamot', 'Cerise']
+    True ['Amaranth', 'Bergamot', 'Cerise']
+    True ['Amaranth', 'Bergamot', 'Cerise']
+    True ['Amaranth', 'Bergamot', 'Cerise']
+    True ['Amaranth', 'Bergamot', 'Cerise']
+    True ['Amaranth', 'Bergamot', 'Cerise']
+    >>> from tracegen import City
+    >>> _ = City(drivers=20, rate=5, seed=2).write(filename, 200)
+    >>> names = {}
+    >>> expected = [_pack(event, names) for event in iter_events(filename)]
+    >>> found = {}
+    >>> b''.join(pack_text(filename, found, 1000)) == b''.join(expected)
+    True
+    >>> found == names and list(found) == list(names)
+    True
+    >>> with open(filename, 'a') as file:
+    ...     _ = file.write('\\n4 RiderRequest Dill 4,2 1\\n')
+    >>> for records in pack_text(filename, {}):
+    ...     pass
+    Traceback (most recent call last):
+    ...
+    ValueError: Malformed event line: 4 RiderRequest Dill 4,2 1
+    >>> os.remove(filename)
+    """
+    with open(source, 'r') as file:
+        rest = ''
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                lines = rest
+            else:
+                rest += chunk
+                end = rest.rfind('\n') + 1
+                if not end:
+                    continue
+                lines, rest = rest[:end], rest[end:]
+            if lines:
+                records = None
+                if vectorized and numpy is not None:
+                    records = _pack_chunk(lines, names)
+                if records is None:
+                    records = _pack_lines(lines, names)
+                yield records
+            if not chunk:
+                return
+
+
+def _pack_chunk(lines: str, names: Dict[str, int]) -> Optional[bytes]:
+    """Return the records for the events on <lines> with NumPy, adding the
+    identifier of each actor to <names> if it is not there already, or None
+    if <lines> is not all in the usual layout.
+
+    """
+    if not lines.endswith('\n'):
+        lines += '\n'
+    if _CANONICAL.fullmatch(lines) is None \
+            or lines.count('Request ') != lines.count('\n'):
+        # Also leave any actor named like an event type to _pack_lines.
+        return None
+    actors = _ACTOR.findall(lines)
+    # Replace the event type and identifier with the kind and zeros, so
+    # that every line is seven numbers.
+    lines = _DRIVER.sub(_DRIVER_NUMBERS, lines)
+    lines = _RIDER.sub(_RIDER_NUMBERS, lines).replace(',', ' ')
+    values = numpy.fromstring(lines, dtype=numpy.int64, sep=' ')
+    if len(values) != 7 * len(actors):
+        return None
+    values = values.reshape(-1, 7)
+    fields = values[:, 2:]
+    if fields.size and (fields.min() < -2 ** 31 or fields.max() >= 2 ** 31):
+        return None
+    new = [actor for actor in dict.fromkeys(actors) if actor not in names]
+    names.update(zip(new, range(len(names), len(names) + len(new))))
+    driver = values[:, 1] == DRIVER_REQUEST
+    records = numpy.zeros(len(values), dtype=_RECORD_DTYPE)
+    records['timestamp'] = values[:, 0]
+    records['kind'] = values[:, 1]
+    records['name'] = list(map(names.__getitem__, actors))
+    records['row'] = numpy.where(driver, values[:, 4], values[:, 2])
+    records['col'] = numpy.where(driver, values[:, 5], values[:, 3])
+    records['other_row'] = numpy.where(driver, 0, values[:, 4])
+    records['other_col'] = numpy.where(driver, 0, values[:, 5])
+    records['speed'] = numpy.where(driver, values[:, 6], 0)
+    records['patience'] = numpy.where(driver, 0, values[:, 6])
+    return records.tobytes()
+
+
+def _pack_lines(lines: str, names: Dict[str, int]) -> bytes:
+    """Return the records for the events on <lines>, one line at a time,
+    adding the identifier of each actor to <names> if it is not there
+    already.
+
+    """
+    records = []
+    for line in lines.splitlines():
+        tokens = line.split()
+        try:
+            if len(tokens) == 5 and tokens[1] == 'DriverRequest' \
+                    and tokens[3].count(',') == 1:
+                row, col = tokens[3].split(',')
+                records.append(RECORD.pack(
+                    int(tokens[0]), DRIVER_REQUEST,
+                    names.setdefault(tokens[2], len(names)),
+                    int(row), int(col), 0, 0, int(tokens[4]), 0))
+                continue
+            if len(tokens) == 6 and tokens[1] == 'RiderRequest' \
+                    and tokens[3].count(',') == 1 \
+                    and tokens[4].count(',') == 1:
+                row, col = tokens[3].split(',')
+                other_row, other_col = tokens[4].split(',')
+                records.append(RECORD.pack(
+                    int(tokens[0]), RIDER_REQUEST,
+                    names.setdefault(tokens[2], len(names)),
+                    int(row), int(col), int(other_row), int(other_col), 0,
+                    int(tokens[5])))
+                continue
+        except ValueError:
+            pass
+        # Blank lines, comments, anything unusual and anything malformed.
+        event = parse_line(line)
+        if event is not None:
+            records.append(_pack(event, names))
+    return b''.join(records)
+
+
+def _pack(event: Event, names: Dict[str, int]) -> bytes:
+    """Return the record for <event>, adding the identifier of its actor to
+    <names> if it is not there already.
+
+    """
+    if isinstance(event, DriverRequest):
+        driver = event.driver
+        name = names.setdefault(driver.id, len(names))
+        return RECORD.pack(event.timestamp, DRIVER_REQUEST, name,
+                           driver.location.row, driver.location.col, 0, 0,
+                           driver.speed, 0)
+    rider = event.rider
+    name = names.setdefault(rider.id, len(names))
+    return RECORD.pack(event.timestamp, RIDER_REQUEST, name,
+                       rider.origin.row, rider.origin.col,
+                       rider.destination.row, rider.destination.col,
+                       0, rider.patience)
+
+
+def read_events(filename: str) -> Iterator[Event]:
+    """Yield the events in the binary trace <filename>, in order.
+
+    The file is memory-mapped and its records are unpacked straight from the
+    mapping, so the result can be passed to Simulation.run as a stream.
+
+    >>> import os, tempfile
+    >>> from event import create_event_list
+    >>> handle, filename = tempfile.mkstemp()
+    >>> os.close(handle)
+    >>> convert('events.txt', filename)
+    12
+    >>> [str(event) for event in read_events(filename)] == \\
+    ...     [str(event) for event in create_event_list('events.txt')]
+    True
+    >>> os.remove(filename)
+    """
+    with mapped_records(filename, MAGIC, VERSION, RECORD,
+                        'binary trace') as (names, records):
+        for (timestamp, kind, name, row, col, other_row, other_col,
+             speed, patience) in RECORD.iter_unpack(records):
+            if kind == DRIVER_REQUEST:
+                yield DriverRequest(
+                    timestamp,
+                    Driver(names[name], intern_location(row, col), speed))
+            else:
+                yield RiderRequest(
+                    timestamp,
+                    Rider(names[name], patience, intern_location(row, col),
+                          intern_location(other_row, other_col)))
+
+
+@contextmanager
+def mapped_records(filename: str, magic: bytes, version: int,
+                   record: struct.Struct,
+                   kind: str) -> Iterator[Tuple[List[str], memoryview]]:
+    """Memory-map the binary file <filename>, laid out as a header, records
+    and a name table, and return its name table and a view of its records,
+    to be unpacked with record.iter_unpack.
+
+    Raise a ValueError naming the <kind> of file expected if the header does
+    not have the given <magic> and <version>. The view must not be used
+    after the with statement.
+    """
+    with open(filename, 'rb') as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        found_magic, found_version, count, names_offset = \
+            HEADER.unpack_from(data)
+        if found_magic != magic or found_version != version:
+            raise ValueError('{} is not a version {} {}'.format(
+                filename, version, kind))
+        names = data[names_offset:].decode().split('\n')
+        view = memoryview(data)[HEADER.size:HEADER.size + count * record.size]
+        try:
+            yield names, view
+        finally:
+            # The mapping cannot be closed while the view still points
+            # into it.
+            view.release()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit('usage: python tracefile.py <events.txt> <events.bin>')
+    print('converted {} events'.format(convert(sys.argv[1], sys.argv[2])))
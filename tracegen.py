@@ -0,0 +1,154 @@
+"""Synthetic city-scale event traces
+
+A City describes the grid, fleet and demand of a synthetic city, and writes
+traces in the text format read by event.create_event_list. Every driver
+requests a rider at time 0, and riders then arrive as a Poisson process.
+Rider origins can cluster around hotspots, such as a stadium or a station.
+
+Write a trace from the command line with, e.g.
+
+    python tracegen.py city.txt --riders 100000 --rate 80 --hotspots 5
+"""
+
+import argparse
+import random
+from typing import Iterator, List, Tuple
+from location import Location
+
+PATIENCE_DISTRIBUTIONS = ('uniform', 'exponential')
+
+
+class City:
+    """A synthetic city to generate traces for.
+
+    === Attributes ===
+    grid: The highest row and column of any location.
+    drivers: The number of drivers.
+    rate: The average number of rider requests per time unit.
+    patience: The lowest and highest patience of a rider.
+    distribution: How patience is distributed between its bounds: 'uniform',
+        or 'exponential' with a mean halfway between them.
+    hotspots: The locations that rider origins cluster around.
+    hotspot_share: The fraction of rider origins near a hotspot; the others
+        are spread uniformly over the grid.
+    seed: The seed of the random numbers in every trace.
+    """
+    grid: int
+    drivers: int
+    rate: float
+    patience: Tuple[int, int]
+    distribution: str
+    hotspots: List[Location]
+    hotspot_share: float
+    seed: int
+
+    def __init__(self, grid: int = 100, drivers: int = 100,
+                 rate: float = 1.0, patience: Tuple[int, int] = (5, 30),
+                 distribution: str = 'uniform', hotspots: int = 0,
+                 hotspot_share: float = 0.5, seed: int = 0) -> None:
+        """Initialize a City with <hotspots> hotspots at random locations.
+
+        """
+        if distribution not in PATIENCE_DISTRIBUTIONS:
+            raise ValueError("Unknown patience distribution: {}".format(
+                distribution))
+        self.grid = grid
+        self.drivers = drivers
+        self.rate = rate
+        self.patience = patience
+        self.distribution = distribution
+        self.hotspot_share = hotspot_share
+        self.seed = seed
+        rand = random.Random(seed)
+        self.hotspots = [self._uniform(rand) for _ in range(hotspots)]
+
+    def _uniform(self, rand: random.Random) -> Location:
+        """Return a location chosen uniformly from the grid.
+
+        """
+        return Location(rand.randint(0, self.grid), rand.randint(0, self.grid))
+
+    def _origin(self, rand: random.Random) -> Location:
+        """Return a rider origin, near a hotspot or anywhere on the grid.
+
+        """
+        if not self.hotspots or rand.random() >= self.hotspot_share:
+            return self._uniform(rand)
+        centre = rand.choice(self.hotspots)
+        spread = max(self.grid / 20, 1)
+        return Location(
+            min(max(round(rand.gauss(centre.row, spread)), 0), self.grid),
+            min(max(round(rand.gauss(centre.col, spread)), 0), self.grid))
+
+    def _patience(self, rand: random.Random) -> int:
+        """Return a rider patience.
+
+        """
+        low, high = self.patience
+        if self.distribution == 'uniform':
+            return rand.randint(low, high)
+        return min(max(round(rand.expovariate(2 / (low + high))), low), high)
+
+    def lines(self, riders: int) -> Iterator[str]:
+        """Yield the lines of a trace with self.drivers DriverRequests and
+        <riders> RiderRequests, in timestamp order.
+
+        >>> city = City(grid=10, drivers=1, rate=2, hotspots=1)
+        >>> for line in city.lines(2):
+        ...     print(line)
+        0 DriverRequest d0 2,9 1
+        0 RiderRequest r0 6,5 6,3 8
+        0 RiderRequest r1 6,6 9,0 27
+        """
+        rand = random.Random(self.seed + 1)
+        for i in range(self.drivers):
+            yield '0 DriverRequest d{} {} {}'.format(
+                i, self._uniform(rand), rand.randint(1, 3))
+        now = 0.0
+        for i in range(riders):
+            yield '{} RiderRequest r{} {} {} {}'.format(
+                int(now), i, self._origin(rand), self._uniform(rand),
+                self._patience(rand))
+            now += rand.expovariate(self.rate)
+
+    def write(self, filename: str, riders: int) -> int:
+        """Write a trace with <riders> RiderRequests to <filename>, and return
+        the number of events in it.
+
+        """
+        count = 0
+        with open(filename, 'w') as file:
+            for line in self.lines(riders):
+                file.write(line + '\n')
+                count += 1
+        return count
+
+
+def main() -> None:
+    """Parse the command line and write the requested trace.
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('trace', help='the event file to write')
+    parser.add_argument('--riders', type=int, default=10000)
+    parser.add_argument('--drivers', type=int, default=100)
+    parser.add_argument('--grid', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help='rider requests per time unit')
+    parser.add_argument('--patience', type=int, nargs=2, default=[5, 30],
+                        metavar=('LOW', 'HIGH'))
+    parser.add_argument('--distribution', choices=PATIENCE_DISTRIBUTIONS,
+                        default='uniform')
+    parser.add_argument('--hotspots', type=int, default=0)
+    parser.add_argument('--hotspot-share', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    city = City(args.grid, args.drivers, args.rate, tuple(args.patience),
+                args.distribution, args.hotspots, args.hotspot_share,
+                args.seed)
+    print('{} events'.format(city.write(args.trace, args.riders)))
+
+
+if __name__ == '__main__':
+    main()